@@ -0,0 +1,30 @@
+"""
+gunicorn settings for running several workers: gunicorn news.wsgi
+
+Workers write metrics to files in PROMETHEUS_MULTIPROC_DIR, and /metrics sums
+them up. The directory is wiped on start, because it keeps values of workers
+from the previous run.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'news-metrics'))
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    # значения livesum-метрик (глубина очереди просмотров) завершенного воркера больше не учитываются
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
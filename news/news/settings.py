@@ -42,20 +42,29 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pagenew.middleware.ServerTimingMiddleware',
+    'pagenew.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'pagenew.middleware.AsyncViewsMiddleware',
+    'pagenew.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'pagenew.middleware.ViewTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'news.urls'
+# маршруты для запросов через ASGI: публичные страницы обслуживаются асинхронными представлениями
+ASYNC_URLCONF = 'news.urls_async'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с учетом времени отрисовки в профиле запроса
+        'BACKEND': 'pagenew.services.profiling.ProfiledDjangoTemplates',
+        'NAME': 'django',
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,9 +86,122 @@ WSGI_APPLICATION = 'news.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 с WAL, PRAGMA при подключении и последовательной записью (см. news/sqlite_backend)
+        'ENGINE': 'news.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # постоянные соединения: PRAGMA и прогрев кеша страниц не повторяются на каждый запрос
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # ожидание блокировки на уровне драйвера, секунд
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 20000,
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -20000,
+                'temp_store': 'MEMORY',
+            },
+        },
+    }
+}
+
+# Профилирование запросов (pagenew.middleware.ServerTimingMiddleware): доля
+# профилируемых запросов, бюджеты числа SQL-запросов и времени ответа, порог
+# одинаковых запросов из одного места, после которого запрос помечается как N+1.
+PERFORMANCE_PROFILING = {
+    'SAMPLE_RATE': float(os.environ.get('NEWS_PROFILE_SAMPLE_RATE', 1.0 if DEBUG else 0.01)),
+    'QUERY_BUDGET': 20,
+    'LATENCY_BUDGET_MS': 300,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SERVER_TIMING_HEADER': True,
+}
+
+# Метрики Prometheus на /metrics (pagenew.services.metrics, нужен prometheus_client).
+# При запуске нескольких воркеров gunicorn задает общий каталог в переменной окружения
+# PROMETHEUS_MULTIPROC_DIR (news/gunicorn.conf.py), и /metrics суммирует значения всех
+# воркеров. Настройкой Django каталог не задается: prometheus_client читает переменную при импорте.
+METRICS = {
+    'ENABLED': True,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'pagenew.performance': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Реплики для чтения публичных страниц (pagenew.routers.PrimaryReplicaRouter).
+# Перечисляются в переменной окружения NEWS_DB_REPLICAS через запятую; локально
+# каждая реплика - файл db_<alias>.sqlite3, который обновляет команда sync_replica.
+DATABASE_REPLICAS = [alias for alias in os.environ.get('NEWS_DB_REPLICAS', '').split(',') if alias]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db_{alias}.sqlite3',
+        # реплики только читаются: транзакции без блокировки записи
+        'OPTIONS': {**DATABASES['default']['OPTIONS'], 'transaction_mode': 'DEFERRED', 'write_lock': False},
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['pagenew.routers.PrimaryReplicaRouter']
+
+# STICKY_SECONDS - сколько секунд после изменения данных пользователь читает с основной базы,
+# MAX_LAG - реплика, отстающая больше чем на столько секунд, не используется
+REPLICA_ROUTING = {
+    'STICKY_SECONDS': 30,
+    'HEALTH_CHECK_INTERVAL': 5,
+    'MAX_LAG': 300,
+}
+
+# Кеш отрисованных страниц и карточек новостей, общий для всех процессов
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
+
+# Буферизованная запись просмотров статей (pagenew.services.view_recorder).
+# При аварийном завершении процесса теряется не больше MAX_PENDING просмотров
+# за последние FLUSH_INTERVAL секунд.
+VIEW_RECORDING = {
+    'QUEUE': 'pagenew.services.view_recorder.LocalViewQueue',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 2000,
+    # 'exact' - строка ViewCount на пару (статья, IP), 'hll' - HyperLogLog-счетчики
+    # без ViewCount и с ограниченным размером базы
+    'UNIQUE_MODE': 'exact',
+    'HLL_ERROR_RATE': 0.02,
+    # период полураспада оценки популярности для /news/trending/
+    'TRENDING_HALF_LIFE_HOURS': 24,
+}
+# Через сколько дней после архивации статьи удалять ее записи ViewCount
+# (команда rollup_views); у открытых статей они нужны для учета уникальных IP,
+# поэтому в режиме 'exact' ViewCount растет без ограничения - рост ограничивает только 'hll'
+VIEW_RAW_RETENTION_DAYS = 90
+
+
+# Уменьшенные копии загружаемых изображений (pagenew.services.images), требуют Pillow.
+# Форматы, которые сборка Pillow не умеет кодировать (avif в старых версиях), пропускаются
+PICTURE_DERIVATIVES = {
+    'WIDTHS': [320, 640, 1024],
+    'FORMATS': ['avif', 'webp', 'jpeg'],
+    'QUALITY': 80,
+    'DIRECTORY': 'static/img/derivatives/',
+    'WORKERS': 2,
 }
 
 
@@ -128,4 +250,7 @@ LOGOUT_REDIRECT_URL = '/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 AUTH_USER_MODEL = 'pagenew.User'
+# роль пользователя берется из кеша ролей процесса, а сессия - из кеша
+AUTHENTICATION_BACKENDS = ['pagenew.backends.CachedRoleBackend']
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
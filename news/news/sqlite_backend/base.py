@@ -0,0 +1,125 @@
+"""
+SQLite backend for serving the site from several workers.
+
+Compared to django.db.backends.sqlite3 it:
+
+* applies PRAGMAs from OPTIONS['pragmas'] to every new connection (WAL journal,
+  synchronous=NORMAL, busy timeout, mmap and page cache sizes by default), so
+  readers never block on the writer and the writer does not block readers;
+* starts every transaction with BEGIN IMMEDIATE (OPTIONS['transaction_mode']).
+  In WAL mode a deferred transaction that reads first and writes later fails
+  with "database is locked" (SQLITE_BUSY_SNAPSHOT) right away if another
+  connection committed after its read, and busy_timeout does not help. Django
+  admin, archive() and the maintenance commands all read before writing inside
+  atomic(), so the write lock is taken up front and waited for up to
+  busy_timeout. Replicas, which are only read, use OPTIONS['transaction_mode']
+  = 'DEFERRED';
+* serializes transactions of one process on one database file through a lock,
+  so threads queue in order instead of polling SQLite's busy handler. Only
+  aliases with OPTIONS['write_lock'] (the default) take it; replicas turn it off;
+* accepts select_for_update(): the transaction already holds the write lock,
+  so FOR UPDATE is dropped from the query instead of being rejected.
+
+Writes in autocommit mode (a save() or update() outside atomic()) are single
+statements and do not take the process lock; they wait on SQLite's own lock
+through busy_timeout.
+"""
+import re
+import threading
+
+from django.db.backends.sqlite3 import base, features
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # отрицательное значение - размер в КиБ
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+FOR_UPDATE_RE = re.compile(r'\s+FOR UPDATE\b')
+
+# один пишущий поток на процесс для каждого файла базы
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def get_write_lock(name):
+    with _write_locks_lock:
+        return _write_locks.setdefault(str(name), threading.RLock())
+
+
+class DatabaseFeatures(features.DatabaseFeatures):
+    # транзакция и так начата с блокировкой записи, FOR UPDATE вырезается из запроса
+    has_select_for_update = True
+
+
+def strip_for_update(query):
+    return FOR_UPDATE_RE.sub('', query) if ' FOR UPDATE' in query else query
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    def execute(self, query, params=None):
+        return super().execute(strip_for_update(query), params)
+
+    def executemany(self, query, param_list):
+        return super().executemany(strip_for_update(query), param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    features_class = DatabaseFeatures
+    holds_write_lock = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        self.transaction_mode = params.pop('transaction_mode', 'IMMEDIATE')
+        self.write_lock = get_write_lock(self.settings_dict['NAME']) if params.pop('write_lock', True) else None
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=SQLiteCursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        self._acquire_write_lock()
+        try:
+            self.connection.execute(f'BEGIN {self.transaction_mode or ""}'.strip())
+        except BaseException:
+            self._release_write_lock()
+            raise
+
+    def _acquire_write_lock(self):
+        if self.write_lock is not None and not self.holds_write_lock:
+            self.write_lock.acquire()
+            self.holds_write_lock = True
+
+    def _release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            self.write_lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
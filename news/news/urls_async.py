@@ -0,0 +1,13 @@
+"""
+URL configuration for requests served through ASGI.
+
+Same routes as news.urls, but the public news pages are served by the async views
+(see pagenew.middleware.AsyncViewsMiddleware).
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include('pagenew.urls_async')),
+]
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Role, User, New, Picture, ViewCount
+from .models import Role, User, New, Picture, ViewCount, ViewDailyAggregate
 from .forms import RoleAdminForm, UserAdminForm, NewAdminForm, PictureAdminForm, ViewCountAdminForm
 from django.contrib.auth.forms import AdminPasswordChangeForm
 
@@ -16,9 +16,8 @@ class RoleAdmin(admin.ModelAdmin):
         obj.delete()
 
     def delete_queryset(self, request, queryset):
-        """ Переопределение метода удаления для группы объектов. """
-        for obj in queryset:
-            obj.delete()
+        """ Переопределение метода удаления для группы объектов: архивация одним запросом. """
+        queryset.archive()
 
 
 admin.site.register(Role, RoleAdmin)
@@ -40,9 +39,8 @@ class UserAdmin(admin.ModelAdmin):
         obj.delete()
 
     def delete_queryset(self, request, queryset):
-        """ Переопределение метода удаления для группы объектов. """
-        for obj in queryset:
-            obj.delete()
+        """ Переопределение метода удаления для группы объектов: архивация одним запросом. """
+        queryset.archive()
 
 
 admin.site.register(User, UserAdmin)
@@ -62,9 +60,8 @@ class NewAdmin(admin.ModelAdmin):
         obj.delete()
 
     def delete_queryset(self, request, queryset):
-        """ Переопределение метода удаления для группы объектов. """
-        for obj in queryset:
-            obj.delete()
+        """ Переопределение метода удаления для группы объектов: архивация одним запросом. """
+        queryset.archive()
 
 
 admin.site.register(New, NewAdmin)
@@ -83,9 +80,8 @@ class PictureAdmin(admin.ModelAdmin):
         obj.delete()
 
     def delete_queryset(self, request, queryset):
-        """ Переопределение метода удаления для группы объектов. """
-        for obj in queryset:
-            obj.delete()
+        """ Переопределение метода удаления для группы объектов: архивация одним запросом. """
+        queryset.archive()
 
 
 admin.site.register(Picture, PictureAdmin)
@@ -95,4 +91,14 @@ class ViewCountAdmin(admin.ModelAdmin):
     form = ViewCountAdminForm
 
 
-admin.site.register(ViewCount, ViewCountAdmin)
\ No newline at end of file
+admin.site.register(ViewCount, ViewCountAdmin)
+
+
+class ViewDailyAggregateAdmin(admin.ModelAdmin):
+    list_display = ['new', 'day', 'views', 'unique_ips', 'compacted']
+    list_filter = ('day',)
+    list_select_related = ('new',)
+    list_per_page = 10
+
+
+admin.site.register(ViewDailyAggregate, ViewDailyAggregateAdmin)
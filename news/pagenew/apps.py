@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PagenewConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pagenew'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,118 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.views import View
+from django.views.generic.detail import BaseDetailView
+
+from . import views
+from .mixins import ConditionalPageMixin, build_validators, set_validators
+from .services.metrics import observe_cache
+from .services.page_cache import aget_page_version, build_page_key, get_cache_query, get_page_cache, punch_holes
+from .services.utils import get_client_ip
+from .services.view_recorder import record_view_in_background
+
+
+def render_page(page, request):
+    """
+    Отрисовывает синхронную страницу page так же, как ее get(). Выполняется в потоке:
+    контекст читает базу, а фрагменты {% cache %} шаблона - синхронный API кеша.
+    """
+    if isinstance(page, BaseDetailView):
+        page.object = page.get_object()
+        context = page.get_context_data(object=page.object)
+    else:
+        page.object_list = page.get_queryset()
+        context = page.get_context_data()
+    return render_to_string(page.template_name, context, request)
+
+
+class AsyncNewsPageView(View):
+    """
+    Асинхронный вариант страницы view_class для ASGI.
+
+    Повторяет поведение синхронной страницы (ConditionalPageMixin + CachedPageMixin):
+    валидаторы и 304, кеш страницы по поколению контента с подстановкой
+    пользовательских фрагментов. Валидаторы и саму страницу строит синхронная
+    страница, по одному переходу в поток через sync_to_async: там же выполняются
+    запросы контекста и обращения фрагментов {% cache %} к кешу. Для страницы
+    из кеша валидаторы хранятся вместе с ней. Кеш страниц (aget/aset) и ответ 304
+    обрабатываются в цикле событий; пользователь загружается заранее через
+    request.auser(), поэтому подстановка фрагментов навигации не обращается к базе.
+    """
+    view_class = None
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.page = self.view_class()
+        self.page.setup(request, *args, **kwargs)
+
+    async def get_validators(self, request, *args, **kwargs):
+        """ Возвращает (источник ETag, дата изменения) или None, если валидаторов нет. """
+        if not isinstance(self.page, ConditionalPageMixin):
+            return None
+        return await sync_to_async(self.page.get_validators)(request, *args, **kwargs)
+
+    async def render(self, content_version):
+        self.page.content_version = content_version
+        return await sync_to_async(render_page)(self.page, self.request)
+
+    def on_cache_hit(self, request, *args, **kwargs):
+        """ Вызывается, когда страница отдана из кеша. """
+
+    def on_not_modified(self, request, *args, **kwargs):
+        """ Вызывается перед ответом 304. """
+
+    async def get(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        content_version = await aget_page_version()
+        page_cache = get_page_cache()
+        key = build_page_key(request, content_version, get_cache_query(request, self.page.page_cache_params))
+        page = await page_cache.aget(key)
+        observe_cache('page', page is not None)
+
+        # у закешированной страницы валидаторы хранятся вместе с ней (CachedPageMixin)
+        validators = page['validators'] if page else await self.get_validators(request, *args, **kwargs)
+        if validators is not None:
+            etag, last_modified = build_validators(request, *validators)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                if response.status_code == 304:
+                    self.on_not_modified(request, *args, **kwargs)
+                return response
+
+        if page is None:
+            page = {'html': await self.render(content_version), 'validators': validators}
+            await page_cache.aset(key, page, self.page.page_cache_timeout)
+        else:
+            self.on_cache_hit(request, *args, **kwargs)
+        response = HttpResponse(punch_holes(page['html'], request))
+        if validators is not None:
+            set_validators(response, etag, last_modified)
+        return response
+
+
+class AsyncHomePageView(AsyncNewsPageView):
+    view_class = views.HomePageView
+
+
+class AsyncNewPageView(AsyncNewsPageView):
+    view_class = views.NewPageView
+
+
+class AsyncNewDetailView(AsyncNewsPageView):
+    """
+    Асинхронный вариант NewDetailView. Без кеша просмотр записывает сама страница
+    при загрузке новости, а при ответе из кеша или 304 он ставится в очередь
+    в фоне и не задерживает ответ.
+    """
+    view_class = views.NewDetailView
+
+    def record_view(self, pk):
+        record_view_in_background(pk, get_client_ip(self.request))
+
+    def on_cache_hit(self, request, *args, **kwargs):
+        self.record_view(kwargs['pk'])
+
+    def on_not_modified(self, request, *args, **kwargs):
+        self.record_view(kwargs['pk'])
@@ -0,0 +1,21 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .models import User
+from .services.roles import get_role_by_id
+
+
+class CachedRoleBackend(ModelBackend):
+    """
+    Бэкенд аутентификации, который подставляет роль пользователя из кеша ролей
+    процесса, поэтому проверка user.role.title в шаблонах не делает отдельный запрос.
+    """
+    def get_user(self, user_id):
+        try:
+            user = User._default_manager.get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        if user.role_id is not None:
+            role = get_role_by_id(user.role_id)
+            if role is not None:
+                user.role = role
+        return user if self.user_can_authenticate(user) else None
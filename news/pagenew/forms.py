@@ -1,6 +1,7 @@
 from django import forms
 from .models import Role, User, Picture, New, ViewCount
 from django.contrib.auth.hashers import make_password, is_password_usable
+from .services.roles import get_or_create_role
 class RoleAdminForm(forms.ModelForm):
     """
        Форма административного интерфейса для управления ролями пользователей.
@@ -96,7 +97,7 @@ class UserAdminForm(forms.ModelForm):
             if user.pk:
                 old_password = User.objects.get(pk=user.pk).password
                 user.password = old_password
-            user_role, created = Role.objects.get_or_create(title='Клиент')
+            user_role = get_or_create_role('Клиент')
             user.role = user_role
         if user.pk and is_password_usable(user.password):
             user.password = make_password(user.password)
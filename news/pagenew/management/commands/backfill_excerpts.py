@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pagenew.models import New
+from pagenew.services.excerpts import make_excerpt
+from pagenew.services.page_cache import bump_content_version
+
+
+class Command(BaseCommand):
+    """
+    Заполняет анонс и количество слов у новостей, сохраненных до появления этих полей.
+
+    Новости читаются порциями по id (только id и описание) и обновляются через
+    bulk_update, поэтому дата изменения новостей не меняется. В конце сбрасывается
+    кеш страниц, чтобы карточки отрисовались с анонсами.
+    """
+    help = 'Заполняет анонсы и количество слов новостей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество статей, читаемых из базы за один запрос')
+        parser.add_argument('--all', action='store_true',
+                            help='Пересчитать анонсы у всех новостей, а не только у незаполненных')
+
+    def handle(self, *args, **options):
+        queryset = New.objects.all() if options['all'] else New.objects.filter(word_count=0)
+        updated = 0
+        last_id = 0
+        while True:
+            news = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'description')
+                        [:options['chunk_size']])
+            if not news:
+                break
+            for new in news:
+                new.excerpt, new.word_count = make_excerpt(new.description)
+            with transaction.atomic():
+                New.objects.bulk_update(news, ['excerpt', 'word_count'])
+            updated += len(news)
+            last_id = news[-1].pk
+            self.stdout.write(f'Обновлено статей: {updated}')
+        if updated:
+            bump_content_version()
+        self.stdout.write(self.style.SUCCESS(f'Анонсы заполнены у {updated} статей'))
@@ -0,0 +1,176 @@
+import json
+import random
+import subprocess
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from pagenew.models import New, Picture, User, ViewCount
+from pagenew.services.benchmark import run_wsgi_load
+from pagenew.services.pagination import CursorPaginator
+from pagenew.services.view_recorder import get_view_recorder
+from pagenew.views import NewPageView
+
+SCENARIOS = ('home', 'feed_first', 'feed_deep', 'detail', 'mixed')
+DEEP_PAGES = (10, 100, 1000)
+DETAIL_SAMPLE = 200
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный замер публичных страниц через WSGI-приложение Django без сервера.
+
+    Сценарии: главная (home), первая страница ленты (feed_first), глубокие страницы
+    ленты по курсорам (feed_deep), страницы новостей (detail) и их смесь (mixed).
+    Каждый сценарий прогревается и нагружается concurrency потоками, для него
+    считаются запросы/с и задержки p50/p95/p99. Результаты сохраняются в JSON
+    вместе с коммитом и размером данных, --compare выводит разницу с прошлым прогоном.
+
+    Отладочный режим и профилирование запросов на время замера выключаются;
+    --no-cache дополнительно заменяет кеш на DummyCache, чтобы мерить отрисовку
+    страниц, а не отдачу из кеша. Данные для замеров создает команда seed_data.
+    """
+    help = 'Замеряет пропускную способность и задержки главной, ленты и страниц новостей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--duration', type=float, default=10, help='Длительность замера сценария, секунд')
+        parser.add_argument('--warmup', type=float, default=2, help='Длительность прогрева сценария, секунд')
+        parser.add_argument('--concurrency', type=int, default=8, help='Количество параллельных клиентов')
+        parser.add_argument('--no-cache', action='store_true', help='Замерять без кеша страниц')
+        parser.add_argument('--output', type=Path, default=None,
+                            help='Файл результатов (по умолчанию benchmarks/<время>-<коммит>.json)')
+        parser.add_argument('--compare', type=Path, default=None, help='Файл результатов для сравнения')
+
+    def handle(self, *args, **options):
+        baseline = self.load_results(options['compare']) if options['compare'] else None
+        overrides = {
+            'DEBUG': False,
+            'ALLOWED_HOSTS': ['localhost'],
+            'PERFORMANCE_PROFILING': {**settings.PERFORMANCE_PROFILING, 'SAMPLE_RATE': 0},
+        }
+        if options['no_cache']:
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        with override_settings(**overrides):
+            paths = self.build_paths()
+            application = WSGIHandler()
+            results = {}
+            for name in options['scenarios']:
+                if not paths[name]:
+                    self.stdout.write(self.style.WARNING(f'{name}: нет данных, пропущен'))
+                    continue
+                run_wsgi_load(application, paths[name], options['warmup'], options['concurrency'])
+                result = run_wsgi_load(application, paths[name], options['duration'], options['concurrency'])
+                results[name] = {'paths': len(paths[name]), **result.summary()}
+                self.stdout.write(f'{name}: {results[name]}')
+            get_view_recorder().flush()
+
+        report = {
+            'commit': self.git('rev-parse', 'HEAD'),
+            'dirty': bool(self.git('status', '--porcelain', '--untracked-files=no')),
+            'created': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'dataset': {
+                'users': User.objects.count(),
+                'news': New.objects.count(),
+                'pictures': Picture.objects.count(),
+                'views': ViewCount.objects.count(),
+            },
+            'options': {key: options[key] for key in ('duration', 'warmup', 'concurrency', 'no_cache')},
+            'scenarios': results,
+        }
+        output = options['output'] or self.default_output(report)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        self.print_table(results, baseline)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+    def build_paths(self):
+        """ Адреса для каждого сценария; выборка новостей детерминирована при одинаковых данных. """
+        news = New.objects.active()
+        feed = reverse('new')
+        deep = [f'{feed}?cursor={cursor}' for cursor in self.deep_cursors(news)]
+        ids = list(news.order_by('id').values_list('pk', flat=True))
+        step = max(len(ids) // DETAIL_SAMPLE, 1)
+        detail = [reverse('news_detail', args=[pk]) for pk in ids[::step][:DETAIL_SAMPLE]]
+        paths = {
+            'home': [reverse('home')],
+            'feed_first': [feed],
+            'feed_deep': deep,
+            'detail': detail,
+        }
+        # в смеси преобладают страницы новостей, как в реальном трафике: 60% detail,
+        # по 15% главной и первой страницы ленты, 10% глубоких страниц
+        share = max(len(detail) // 4, 1)
+        mixed = detail + [paths['home'][0]] * share + [feed] * share + (deep * share)[:share * 2 // 3]
+        random.Random(0).shuffle(mixed)
+        paths['mixed'] = mixed
+        return paths
+
+    @staticmethod
+    def deep_cursors(news):
+        """ Курсоры страниц DEEP_PAGES ленты, такие же, как в ссылках «следующая страница». """
+        per_page = NewPageView.paginate_by
+        ordered = news.filter(date_of_create__isnull=False).order_by('-date_of_create', '-id')
+        cursors = []
+        for number in DEEP_PAGES:
+            row = ordered.values_list('date_of_create', 'pk')[(number - 1) * per_page - 1:][:1].first()
+            if row is None:
+                break
+            date_of_create, pk = row
+            obj = SimpleNamespace(date_of_create=date_of_create, pk=pk)
+            cursors.append(CursorPaginator.encode_cursor(obj, 'next', number))
+        return cursors
+
+    @staticmethod
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def default_output(report):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        commit = (report['commit'] or 'unknown')[:10]
+        return settings.BASE_DIR / 'benchmarks' / f'{stamp}-{commit}.json'
+
+    @staticmethod
+    def load_results(path):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Не удалось прочитать {path}: {exc}')
+
+    def print_table(self, results, baseline):
+        self.stdout.write(f"{'сценарий':<12}{'запросов':>10}{'ошибок':>8}{'req/s':>10}"
+                          f"{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}")
+        for name, summary in results.items():
+            self.stdout.write(
+                f"{name:<12}{summary['requests']:>10}{summary['errors']:>8}{summary['rps']:>10}"
+                f"{summary['p50']!s:>10}{summary['p95']!s:>10}{summary['p99']!s:>10}"
+            )
+            previous = (baseline or {}).get('scenarios', {}).get(name)
+            if previous:
+                self.stdout.write(
+                    f"{'  разница':<12}{'':>18}{self.change(previous['rps'], summary['rps']):>10}"
+                    f"{self.change(previous['p50'], summary['p50']):>10}"
+                    f"{self.change(previous['p95'], summary['p95']):>10}"
+                    f"{self.change(previous['p99'], summary['p99']):>10}"
+                )
+        if baseline:
+            self.stdout.write(f"Сравнение с {(baseline.get('commit') or 'unknown')[:10]} "
+                              f"от {baseline.get('created')}: изменение в процентах")
+
+    @staticmethod
+    def change(before, after):
+        if not before or after is None:
+            return '-'
+        return f'{(after - before) / before * 100:+.1f}%'
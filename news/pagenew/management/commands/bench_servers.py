@@ -0,0 +1,81 @@
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pagenew.models import New
+from pagenew.services.benchmark import run_load, wait_for_port
+
+SERVERS = {
+    'asgi': ['news.asgi:application'],
+    'wsgi': ['news.wsgi:application', '--interface', 'wsgi'],
+}
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает пропускную способность и задержки публичных страниц под uvicorn
+    в режиме ASGI (асинхронные представления) и WSGI (синхронные представления).
+
+    Каждый сервер запускается отдельным процессом с одним воркером, прогревается
+    и нагружается одинаковым набором адресов через keep-alive соединения.
+    """
+    help = 'Сравнивает запросы/с и задержки страниц под uvicorn в режимах ASGI и WSGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS),
+                            help='Какие варианты запускать')
+        parser.add_argument('--paths', nargs='+', default=None,
+                            help='Адреса страниц (по умолчанию главная, лента и последняя новость)')
+        parser.add_argument('--duration', type=float, default=10, help='Длительность замера, секунд')
+        parser.add_argument('--warmup', type=float, default=2, help='Длительность прогрева, секунд')
+        parser.add_argument('--concurrency', type=int, default=32, help='Количество параллельных соединений')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('Для замеров нужен uvicorn: pip install uvicorn')
+        paths = options['paths'] or self.default_paths()
+        base_url = f"http://{options['host']}:{options['port']}"
+
+        results = {}
+        for name in options['servers']:
+            self.stdout.write(f'{name}: запуск сервера')
+            server = self.start_server(name, options['host'], options['port'])
+            try:
+                if not wait_for_port(options['host'], options['port']):
+                    raise CommandError(f'Сервер {name} не запустился')
+                asyncio.run(run_load(base_url, paths, options['warmup'], options['concurrency']))
+                result = asyncio.run(run_load(base_url, paths, options['duration'], options['concurrency']))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            results[name] = result.summary()
+
+        self.stdout.write(f"Адреса: {', '.join(paths)}; соединений: {options['concurrency']}")
+        self.stdout.write(f"{'сервер':<8}{'запросов':>10}{'ошибок':>8}{'req/s':>10}"
+                          f"{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}")
+        for name, summary in results.items():
+            self.stdout.write(
+                f"{name:<8}{summary['requests']:>10}{summary['errors']:>8}{summary['rps']:>10}"
+                f"{summary['p50']!s:>10}{summary['p95']!s:>10}{summary['p99']!s:>10}{summary['max']!s:>10}"
+            )
+
+    @staticmethod
+    def default_paths():
+        paths = ['/', '/news/']
+        latest = New.objects.active().order_by('-date_of_create', '-id').values_list('pk', flat=True).first()
+        if latest is not None:
+            paths.append(f'/news/{latest}/')
+        return paths
+
+    @staticmethod
+    def start_server(name, host, port):
+        command = [sys.executable, '-m', 'uvicorn', *SERVERS[name], '--host', host, '--port', str(port),
+                   '--workers', '1', '--no-access-log', '--log-level', 'warning']
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy())
@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pagenew.models import Picture
+from pagenew.services.images import (build_job, get_derivative_options, make_derivatives,
+                                     needs_derivatives, pillow_available, save_derivatives)
+
+
+class Command(BaseCommand):
+    """
+    Создает уменьшенные копии (разные ширины, WebP/JPEG) для уже загруженных изображений.
+    """
+    help = 'Создает производные изображения для существующих Picture'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать производные и для изображений, у которых они уже есть')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию PICTURE_DERIVATIVES["WORKERS"])')
+
+    def handle(self, *args, **options):
+        if not pillow_available():
+            raise CommandError('Для создания производных изображений нужен Pillow')
+        workers = options['workers'] or get_derivative_options()['WORKERS']
+        pictures = Picture.objects.active().exclude(path='').order_by('id')
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for picture in pictures.iterator():
+                if not options['all'] and not needs_derivatives(picture):
+                    continue
+                job = build_job(picture)
+                if job is None:
+                    self.stderr.write(f'Файл изображения {picture.pk} не найден: {picture.path.name}')
+                    failed += 1
+                    continue
+                futures[executor.submit(make_derivatives, *job)] = (picture.pk, picture.path.name)
+            for future in as_completed(futures):
+                picture_id, source = futures[future]
+                try:
+                    save_derivatives(picture_id, source, future.result())
+                    done += 1
+                except Exception as error:
+                    self.stderr.write(f'Ошибка обработки изображения {picture_id}: {error}')
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {done}, с ошибками: {failed}'))
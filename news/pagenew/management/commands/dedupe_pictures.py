@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pagenew.models import Picture
+
+
+class Command(BaseCommand):
+    """
+    Переносит файлы изображений, загруженные до хранилища по хешу содержимого,
+    в это хранилище. Одинаковые файлы после переноса хранятся один раз.
+    Старые файлы не удаляются.
+    """
+    help = 'Переводит существующие изображения на хранение по хешу содержимого'
+
+    def handle(self, *args, **options):
+        storage = Picture._meta.get_field('path').storage
+        moved = missing = 0
+        blobs = set()
+        for picture in Picture.objects.exclude(path='').order_by('id').iterator():
+            name = picture.path.name
+            if storage.is_hashed_name(name):
+                blobs.add(name)
+                continue
+            if not storage.exists(name):
+                self.stderr.write(f'Файл изображения {picture.pk} не найден: {name}')
+                missing += 1
+                continue
+            with storage.open(name) as content:
+                new_name = storage.save(name, content)
+            with transaction.atomic():
+                Picture.objects.filter(pk=picture.pk).update(path=new_name)
+            blobs.add(new_name)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено изображений: {moved}, не найдено: {missing}, уникальных файлов: {len(blobs)}'
+        ))
@@ -0,0 +1,76 @@
+import os
+import posixpath
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from pagenew.models import Picture
+from pagenew.services.images import get_derivative_options
+
+
+class Command(BaseCommand):
+    """
+    Удаляет файлы изображений в хранилище по хешу содержимого, на которые не
+    ссылается ни одно неархивное изображение, вместе с их уменьшенными копиями.
+    Файлы вне этого хранилища (например, статические картинки шаблонов) не затрагиваются.
+
+    Файлы моложе --min-age-hours пропускаются: файл сохраняется в хранилище
+    раньше, чем фиксируется транзакция со ссылающимся на него изображением.
+    """
+    help = 'Удаляет неиспользуемые файлы изображений, сохраненные по хешу содержимого'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать файлы, которые будут удалены')
+        parser.add_argument('--min-age-hours', type=float, default=24,
+                            help='Не удалять файлы, измененные позже, чем столько часов назад')
+
+    def handle(self, *args, **options):
+        field = Picture._meta.get_field('path')
+        storage = field.storage
+        references = Counter(
+            Picture.objects.active().exclude(path='').values_list('path', flat=True)
+        )
+        root = field.upload_to
+        derivatives = self.find_derivatives(storage)
+        cutoff = time.time() - options['min_age_hours'] * 3600
+        directories, _ = storage.listdir(root)
+        removed = kept = recent = 0
+        for directory in directories:
+            _, files = storage.listdir(posixpath.join(root, directory))
+            for file_name in files:
+                name = posixpath.join(root, directory, file_name)
+                if not storage.is_hashed_name(name):
+                    continue
+                if references[name]:
+                    kept += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{name}: ссылок {references[name]}')
+                    continue
+                if storage.get_modified_time(name).timestamp() > cutoff:
+                    recent += 1
+                    continue
+                removed += 1
+                stem = os.path.splitext(file_name)[0]
+                self.stdout.write(f'Удаление {name}')
+                for derivative in [name, *derivatives[stem]]:
+                    if options['verbosity'] > 1 and derivative != name:
+                        self.stdout.write(f'Удаление {derivative}')
+                    if not options['dry_run']:
+                        storage.delete(derivative)
+        self.stdout.write(self.style.SUCCESS(
+            f'Используется файлов: {kept}, удалено: {removed}, пропущено новых: {recent}'
+        ))
+
+    @staticmethod
+    def find_derivatives(storage):
+        """ {хеш файла: [имена его уменьшенных копий]} (копии называются <хеш>_<ширина>.<формат>). """
+        directory = get_derivative_options()['DIRECTORY']
+        derivatives = defaultdict(list)
+        if not storage.exists(directory):
+            return derivatives
+        for file_name in storage.listdir(directory)[1]:
+            stem = os.path.splitext(file_name)[0].rpartition('_')[0]
+            derivatives[stem].append(posixpath.join(directory, file_name))
+        return derivatives
@@ -0,0 +1,200 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from pagenew.models import User
+from pagenew.services.roles import get_or_create_role, get_role_by_title
+
+FIELDS = ('email', 'password', 'name', 'date_of_birth', 'login', 'role')
+
+
+def read_rows(path, file_format):
+    """ Построчно читает пользователей из CSV (с заголовком) или NDJSON, возвращает (номер строки, dict). """
+    with open(path, encoding='utf-8', newline='') as source:
+        if file_format == 'csv':
+            for number, row in enumerate(csv.DictReader(source), start=2):
+                yield number, row
+        else:
+            for number, line in enumerate(source, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as error:
+                        yield number, {'__error__': f'Некорректный JSON: {error}'}
+                        continue
+                    if not isinstance(row, dict):
+                        yield number, {'__error__': 'Строка должна быть JSON-объектом'}
+                        continue
+                    yield number, row
+
+
+class Command(BaseCommand):
+    """
+    Массовый импорт пользователей из CSV/NDJSON.
+
+    Пользователи читаются потоком и обрабатываются порциями: проверка полей
+    без обращений к базе, проверка уникальности email/логина одним запросом
+    на порцию, хеширование паролей в пуле процессов и вставка через bulk_create.
+    После каждой порции номер последней обработанной строки сохраняется в файл
+    прогресса, поэтому прерванный импорт продолжается с того же места.
+    Строки с ошибками записываются в отчет и не прерывают импорт.
+    Роли из файла должны уже существовать (и не быть в архиве), иначе строка
+    считается ошибкой; --create-roles разрешает создавать недостающие роли.
+    """
+    help = 'Импортирует пользователей из CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с пользователями (.csv или .ndjson)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help='Формат файла (по умолчанию определяется по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество пользователей в одной порции')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Количество процессов для хеширования паролей')
+        parser.add_argument('--progress-file', default=None,
+                            help='Файл прогресса для продолжения импорта (по умолчанию <path>.progress)')
+        parser.add_argument('--errors-file', default=None,
+                            help='CSV-отчет об ошибках (по умолчанию <path>.errors.csv)')
+        parser.add_argument('--default-role', default='Клиент',
+                            help='Роль для пользователей без поля role (создается, если ее нет)')
+        parser.add_argument('--create-roles', action='store_true',
+                            help='Создавать роли из файла, которых нет в базе')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        progress_file = options['progress_file'] or f'{path}.progress'
+        errors_file = options['errors_file'] or f'{path}.errors.csv'
+        self.default_role = get_or_create_role(options['default_role'])
+        self.create_roles = options['create_roles']
+
+        processed = self.load_progress(progress_file, path)
+        if processed:
+            self.stdout.write(f'Продолжение импорта после строки {processed}')
+        rows = ((number, row) for number, row in read_rows(path, file_format) if number > processed)
+
+        created = failed = 0
+        with open(errors_file, 'a', encoding='utf-8', newline='') as report, \
+                ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            errors = csv.writer(report)
+            if report.tell() == 0:
+                errors.writerow(['line', 'field', 'message'])
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                users, chunk_errors = self.validate_chunk(chunk)
+                passwords = executor.map(make_password, [user.password for _, user in users],
+                                         chunksize=max(len(users) // (options['workers'] * 4), 1))
+                for (_, user), password in zip(users, passwords):
+                    user.password = password
+                inserted, insert_errors = self.insert_chunk(users)
+                chunk_errors.extend(insert_errors)
+                for error in chunk_errors:
+                    errors.writerow(error)
+                report.flush()
+                created += inserted
+                failed += len({error[0] for error in chunk_errors})
+                self.save_progress(progress_file, path, chunk[-1][0])
+                self.stdout.write(f'Строка {chunk[-1][0]}: создано {created}, ошибок {failed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Импорт завершен: создано {created}, ошибок {failed}'))
+        if failed:
+            self.stdout.write(f'Отчет об ошибках: {errors_file}')
+
+    def validate_chunk(self, chunk):
+        """ Проверяет поля и уникальность email/логина. Возвращает ([(строка, User)], [ошибки]). """
+        users, errors = [], []
+        for number, row in chunk:
+            if '__error__' in row:
+                errors.append([number, '', row['__error__']])
+                continue
+            missing = [field for field in FIELDS[:-1] if not row.get(field)]
+            if missing:
+                errors.append([number, ','.join(missing), 'Обязательное поле не заполнено'])
+                continue
+            not_strings = [field for field in FIELDS if row.get(field) and not isinstance(row[field], str)]
+            if not_strings:
+                errors.append([number, ','.join(not_strings), 'Значение должно быть строкой'])
+                continue
+            role = self.get_role(row['role']) if row.get('role') else self.default_role
+            if role is None:
+                errors.append([number, 'role', f'Роль «{row["role"]}» не существует или в архиве'])
+                continue
+            user = User(email=User.objects.normalize_email(row['email']), password=row['password'],
+                        name=row['name'], date_of_birth=row['date_of_birth'], login=row['login'], role=role)
+            try:
+                user.full_clean(exclude=['password', 'role', 'groups', 'user_permissions'], validate_unique=False)
+            except ValidationError as error:
+                for field, messages in error.message_dict.items():
+                    errors.append([number, field, '; '.join(messages)])
+                continue
+            users.append((number, user))
+
+        taken = User.objects.filter(email__in=[user.email for _, user in users]).values_list('email', flat=True)
+        taken_emails = set(taken)
+        taken_logins = set(
+            User.objects.filter(login__in=[user.login for _, user in users]).values_list('login', flat=True)
+        )
+        unique_users = []
+        for number, user in users:
+            if user.email in taken_emails:
+                errors.append([number, 'email', 'Пользователь с таким email уже существует'])
+            elif user.login in taken_logins:
+                errors.append([number, 'login', 'Пользователь с таким логином уже существует'])
+            else:
+                taken_emails.add(user.email)
+                taken_logins.add(user.login)
+                unique_users.append((number, user))
+        return unique_users, errors
+
+    def get_role(self, title):
+        """ Существующая неархивная роль; с --create-roles недостающая роль создается. """
+        if self.create_roles:
+            return get_or_create_role(title)
+        role = get_role_by_title(title)
+        return role if role is not None and not role.is_archived else None
+
+    def insert_chunk(self, users):
+        """ Вставляет порцию одним bulk_create, при конфликте - построчно с отчетом об ошибках. """
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in users])
+            return len(users), []
+        except IntegrityError:
+            inserted, errors = 0, []
+            for number, user in users:
+                try:
+                    with transaction.atomic():
+                        User.objects.bulk_create([user])
+                    inserted += 1
+                except IntegrityError as error:
+                    errors.append([number, '', str(error)])
+            return inserted, errors
+
+    @staticmethod
+    def load_progress(progress_file, path):
+        if not os.path.exists(progress_file):
+            return 0
+        with open(progress_file, encoding='utf-8') as source:
+            progress = json.load(source)
+        if progress.get('source') != os.path.abspath(path):
+            raise CommandError(f'Файл прогресса {progress_file} относится к другому импорту')
+        return progress['processed']
+
+    @staticmethod
+    def save_progress(progress_file, path, processed):
+        temporary = f'{progress_file}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump({'source': os.path.abspath(path), 'processed': processed}, target)
+        os.replace(temporary, progress_file)
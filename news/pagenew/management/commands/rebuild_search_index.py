@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pagenew.models import New
+from pagenew.services.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Перестраивает полнотекстовый индекс FTS5 по всем неархивным новостям.
+    """
+    help = 'Перестраивает полнотекстовый индекс новостей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество статей, читаемых из базы за один запрос')
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite')
+        indexed = rebuild_index(New.objects.active(), options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано статей: {indexed}'))
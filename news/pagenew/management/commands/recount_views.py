@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from pagenew.models import New, ViewCount, ViewDailyAggregate
+from pagenew.services.hyperloglog import HyperLogLog
+from pagenew.services.view_recorder import get_view_recorder
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает хранимые счетчики просмотров статей по таблице ViewCount.
+
+    Статьи обрабатываются порциями по диапазонам id, одним UPDATE с подзапросами
+    на порцию, чтобы не держать блокировку базы на время пересчета всей таблицы. Для архивированных статей,
+    записи которых удалены командой rollup_views, к ним прибавляются новые уникальные IP
+    из помеченных compacted дневных сводок. В режиме UNIQUE_MODE = 'hll'
+    уникальные просмотры берутся из HyperLogLog-счетчика статьи.
+    """
+    help = 'Пересчитывает New.unique_views/total_views по записям ViewCount'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество статей, обрабатываемых за одну транзакцию')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        use_sketches = get_view_recorder().unique_mode == 'hll'
+        last_id = New.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        unique_views = self.unique_views_expression()
+        updated = 0
+        for start in range(0, last_id + 1, chunk_size):
+            # счетчики читаются и пишутся в одной транзакции записи: сброс просмотров,
+            # зафиксированный между чтением и записью, иначе был бы затерт
+            with transaction.atomic():
+                news = New.objects.filter(id__gte=start, id__lt=start + chunk_size)
+                if use_sketches:
+                    updated += self.recount_sketches(news.filter(views_sketch__isnull=False))
+                    news = news.filter(views_sketch__isnull=True)
+                # повторные просмотры в ViewCount не хранятся, поэтому total_views
+                # только поднимается до числа уникальных, но не уменьшается
+                updated += news.update(unique_views=unique_views,
+                                       total_views=Greatest('total_views', unique_views))
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано статей: {updated}'))
+
+    def unique_views_expression(self):
+        """
+        Число уникальных IP статьи: записи ViewCount и, для записей, удаленных
+        командой rollup_views, новые уникальные IP из сводок compacted. Вернувшиеся
+        после удаления посетители записаны в ViewCount заново и в этих сводках не учтены.
+        """
+        rows = (ViewCount.objects.filter(new_id=OuterRef('pk')).order_by()
+                .values('new_id').annotate(count=Count('id')).values('count'))
+        compacted = (ViewDailyAggregate.objects.filter(new_id=OuterRef('pk'), compacted=True).order_by()
+                     .values('new_id').annotate(unique_ips=Sum('unique_ips')).values('unique_ips'))
+        return Coalesce(Subquery(rows), 0) + Coalesce(Subquery(compacted), 0)
+
+    def recount_sketches(self, news):
+        news = list(news.only('id', 'unique_views', 'total_views', 'views_sketch'))
+        for new in news:
+            new.unique_views = HyperLogLog.from_bytes(new.views_sketch).count()
+            new.total_views = max(new.total_views, new.unique_views)
+        New.objects.bulk_update(news, ['unique_views', 'total_views'])
+        return len(news)
@@ -0,0 +1,99 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from pagenew.models import New, ViewCount, ViewDailyAggregate
+
+
+def day_bounds(day):
+    """ Начало и конец дня day в текущем часовом поясе. """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+class Command(BaseCommand):
+    """
+    Восстанавливает дневные сводки ViewDailyAggregate по ViewCount и удаляет старые записи.
+
+    Сводки текущих дней пишет ViewRecorder, поэтому свертка нужна только для дней
+    до появления первой сводки: по ViewCount, где хранится первое посещение статьи
+    с каждого IP, восстанавливается unique_ips, а views остается пустым. Каждый день
+    сворачивается в отдельной транзакции.
+
+    Записи ViewCount - это множество уже учтенных пар (статья, IP): если удалить
+    их у открытой статьи, вернувшиеся посетители снова посчитались бы уникальными.
+    Поэтому по сроку хранения (VIEW_RAW_RETENTION_DAYS) удаляются только записи
+    статей, архивированных раньше этого срока. Каждая порция из --batch-size записей
+    удаляется в своей транзакции, чтобы не держать блокировку записи все время
+    удаления, а сводки статьи помечаются как compacted после последней порции.
+
+    В режиме VIEW_RECORDING['UNIQUE_MODE'] = 'exact' таблица ViewCount открытых
+    статей растет без ограничения: ограничить ее рост можно только режимом 'hll',
+    в котором ViewCount не пишется вовсе.
+    """
+    help = 'Восстанавливает дневные сводки просмотров и удаляет записи ViewCount давно архивированных статей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int,
+                            default=getattr(settings, 'VIEW_RAW_RETENTION_DAYS', None),
+                            help='Сколько дней хранить записи ViewCount архивированных статей (без значения - не удалять)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Количество записей, удаляемых или вставляемых за один запрос')
+
+    def handle(self, *args, **options):
+        rolled_up = self.rollup(options['batch_size'])
+        self.stdout.write(f'Свернуто дней: {rolled_up}')
+        if options['retention_days'] is not None:
+            deleted = self.compact(options['retention_days'], options['batch_size'])
+            self.stdout.write(f'Удалено записей ViewCount: {deleted}')
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def rollup(self, batch_size):
+        first_view = ViewCount.objects.aggregate(first_view=Min('viewed_on'))['first_view']
+        if first_view is None:
+            return 0
+        first_aggregate = ViewDailyAggregate.objects.aggregate(first_day=Min('day'))['first_day']
+        last_day = min(first_aggregate or timezone.localdate(), timezone.localdate())
+
+        rolled_up = 0
+        day = timezone.localdate(first_view)
+        while day < last_day:
+            start, end = day_bounds(day)
+            rows = (
+                ViewCount.objects.filter(viewed_on__gte=start, viewed_on__lt=end)
+                .order_by().values('new_id').annotate(unique_ips=Count('id'))
+            )
+            with transaction.atomic():
+                ViewDailyAggregate.objects.bulk_create(
+                    [ViewDailyAggregate(new_id=row['new_id'], day=day, views=None,
+                                        unique_ips=row['unique_ips']) for row in rows],
+                    batch_size=batch_size,
+                    ignore_conflicts=True,
+                )
+            rolled_up += 1
+            day += timedelta(days=1)
+        return rolled_up
+
+    def compact(self, retention_days, batch_size):
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        # дата изменения архивной статьи - дата ее архивации
+        new_ids = (
+            New.objects.archived().filter(updated_at__lt=cutoff, views__isnull=False)
+            .order_by('id').values_list('id', flat=True).distinct()
+        )
+        deleted = 0
+        for new_id in list(new_ids):
+            while True:
+                with transaction.atomic():
+                    ids = list(ViewCount.objects.filter(new_id=new_id).order_by()
+                               .values_list('id', flat=True)[:batch_size])
+                    if ids:
+                        deleted += ViewCount.objects.filter(id__in=ids).delete()[0]
+                if len(ids) < batch_size:
+                    break
+            ViewDailyAggregate.objects.filter(new_id=new_id).update(compacted=True)
+        return deleted
@@ -0,0 +1,185 @@
+import math
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from pagenew.models import New, Picture, User, ViewCount, ViewDailyAggregate, ViewSketch
+from pagenew.services.popularity import decay_term
+from pagenew.services.roles import get_or_create_role
+from pagenew.services.search import rebuild_index
+from pagenew.services.view_recorder import get_view_recorder
+
+SEED_EMAIL_DOMAIN = 'seed.example'
+WORDS = ('турнир', 'обновление', 'патч', 'событие', 'сервер', 'гильдия', 'рейд', 'сезон', 'награда',
+         'арена', 'клан', 'бета', 'карта', 'режим', 'герой', 'баланс', 'фестиваль', 'рейтинг')
+
+
+class Command(BaseCommand):
+    """
+    Заполняет базу детерминированным синтетическим набором данных для нагрузочных тестов.
+
+    При одинаковых --seed и --anchor создаются одни и те же пользователи, новости,
+    изображения и просмотры. Просмотры распределены между новостями по закону Ципфа
+    (несколько очень популярных новостей и длинный хвост) и сгущаются к дате --anchor.
+    Все данные вставляются пачками: bulk_create для пользователей, новостей и изображений
+    и executemany для ViewCount (bulk_create не позволяет задать viewed_on из-за
+    auto_now_add). Счетчики просмотров и trending_score новостей заполняются сразу,
+    поисковый индекс перестраивается в конце.
+
+    Сгенерированные пользователи получают адреса @seed.example; --clear удаляет их
+    вместе с их новостями и просмотрами перед заполнением.
+    """
+    help = 'Заполняет базу синтетическими пользователями, новостями, изображениями и просмотрами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--news', type=int, default=100_000)
+        parser.add_argument('--pictures-per-new', type=int, default=2)
+        parser.add_argument('--views', type=int, default=20_000_000, help='Общее количество записей ViewCount')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней до --anchor созданы новости')
+        parser.add_argument('--archived-ratio', type=float, default=0.02, help='Доля архивных новостей')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения просмотров')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--anchor', type=date.fromisoformat, default=None,
+                            help='Дата YYYY-MM-DD, от которой отсчитываются даты (по умолчанию сегодня)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Количество новостей в одной порции')
+        parser.add_argument('--clear', action='store_true', help='Удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').exists():
+            raise CommandError('Сгенерированные данные уже есть, используйте --clear')
+
+        self.rng = random.Random(options['seed'])
+        anchor = options['anchor'] or date.today()
+        self.anchor = datetime.combine(anchor, datetime.min.time(), tzinfo=dt_timezone.utc)
+        half_life = get_view_recorder().trending_half_life_hours
+        self.anchor_term = decay_term(1, self.anchor, half_life)
+        self.decay_per_second = math.log(2) / (half_life * 3600)
+        started = time.monotonic()
+
+        users = self.create_users(options['users'])
+        self.stdout.write(f'Пользователей: {len(users)}')
+        view_counts = self.distribute_views(options['news'], options['views'], options['zipf'])
+        news_total = pictures_total = views_total = 0
+        batch_size = options['batch_size']
+        for start in range(0, options['news'], batch_size):
+            counts = view_counts[start:start + batch_size]
+            with transaction.atomic():
+                news = self.create_news(start, counts, users, options['days'], options['archived_ratio'])
+                pictures_total += self.create_pictures(news, options['pictures_per_new'])
+                views_total += self.create_views(news)
+            news_total += len(news)
+            self.stdout.write(f'Новостей: {news_total}, просмотров: {views_total}')
+
+        self.stdout.write('Перестройка поискового индекса')
+        rebuild_index(New.objects.active())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано новостей: {news_total}, изображений: {pictures_total}, просмотров: {views_total} '
+            f'за {time.monotonic() - started:.0f} с'
+        ))
+
+    def clear(self):
+        """
+        Удаляет сгенерированные данные прямыми DELETE: удаление через ORM загрузило бы
+        в память миллионы просмотров и отправило бы сигналы для каждой новости.
+        """
+        seeded_news = (f'SELECT id FROM {New._meta.db_table} WHERE author_id IN '
+                       f'(SELECT id FROM {User._meta.db_table} WHERE email LIKE %s)')
+        pattern = f'%@{SEED_EMAIL_DOMAIN}'
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (ViewCount, ViewSketch, ViewDailyAggregate, Picture):
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE new_id IN ({seeded_news})', [pattern])
+            cursor.execute(f'DELETE FROM {New._meta.db_table} WHERE id IN ({seeded_news})', [pattern])
+            deleted, _ = User.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').delete()
+        self.stdout.write(f'Удалены ранее сгенерированные данные ({deleted} объектов пользователей)')
+
+    def create_users(self, count):
+        role = get_or_create_role('Клиент')
+        # хеширование пароля - самая дорогая часть, у всех сгенерированных пользователей он один
+        password = make_password('seed-password')
+        users = [
+            User(email=f'user{i}@{SEED_EMAIL_DOMAIN}', login=f'seed{i}', name='Игрок', password=password,
+                 date_of_birth=date(1980, 1, 1) + timedelta(days=self.rng.randrange(10000)), role=role)
+            for i in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=1000)
+
+    def distribute_views(self, news_count, views_count, exponent):
+        """ Количество просмотров для каждой новости по закону Ципфа со случайным порядком рангов. """
+        weights = [1 / (rank ** exponent) for rank in range(1, news_count + 1)]
+        self.rng.shuffle(weights)
+        total = sum(weights)
+        counts = [int(views_count * weight / total) for weight in weights]
+        for index in self.rng.sample(range(news_count), min(views_count - sum(counts), news_count)):
+            counts[index] += 1
+        return counts
+
+    def create_news(self, start, counts, users, days, archived_ratio):
+        news = []
+        self.view_offsets = []
+        for offset, count in enumerate(counts):
+            number = start + offset
+            age = self.rng.uniform(0, days * 86400)
+            # просмотры идут после публикации и сгущаются к концу периода (секунды до --anchor)
+            offsets = [age * self.rng.random() ** 3 for _ in range(count)]
+            title_words = self.rng.sample(WORDS, 3)
+            new = New(
+                title=f"{' '.join(title_words).capitalize()} №{number}",
+                description=' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randrange(20, 120))),
+                author=users[self.rng.randrange(len(users))],
+                date_of_create=self.anchor - timedelta(seconds=age),
+                is_archived=self.rng.random() < archived_ratio,
+                total_views=count,
+                unique_views=count,
+                trending_score=self.trending_score(offsets),
+            )
+            new.fill_excerpt()
+            news.append(new)
+            self.view_offsets.append(offsets)
+        return New.objects.bulk_create(news)
+
+    def trending_score(self, offsets):
+        """
+        То же значение, что накопил бы ViewRecorder при записи этих просмотров:
+        ln(сумма весов) со сдвигом на самый свежий просмотр, чтобы exp не уходил в ноль.
+        """
+        if not offsets:
+            return 0
+        newest = min(offsets)
+        weights = math.fsum(math.exp(-(offset - newest) * self.decay_per_second) for offset in offsets)
+        return self.anchor_term - newest * self.decay_per_second + math.log(weights)
+
+    def create_pictures(self, news, per_new):
+        pictures = [
+            Picture(path=f'static/img/seed/{new.pk}_{n}.jpg', new=new)
+            for new in news for n in range(per_new)
+        ]
+        Picture.objects.bulk_create(pictures, batch_size=1000)
+        return len(pictures)
+
+    def create_views(self, news):
+        table = ViewCount._meta.db_table
+        sql = f'INSERT INTO {table} (new_id, ip_address, viewed_on) VALUES (%s, %s, %s)'
+        anchor = self.anchor.timestamp()
+        inserted = 0
+        with connection.cursor() as cursor:
+            for new, offsets in zip(news, self.view_offsets):
+                # адреса уникальны в пределах новости (ограничение unique_view_per_ip);
+                # даты в формате, в котором Django хранит DateTimeField в SQLite (UTC без зоны)
+                rows = [
+                    (new.pk, f'{10 + (n >> 24)}.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}',
+                     datetime.fromtimestamp(anchor - offset, dt_timezone.utc).replace(tzinfo=None).isoformat(' '))
+                    for n, offset in enumerate(offsets)
+                ]
+                if rows:
+                    cursor.executemany(sql, rows)
+                    inserted += len(rows)
+        return inserted
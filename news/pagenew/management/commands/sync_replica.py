@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from pagenew.routers import get_replicas, mark_replica_synced
+from pagenew.services.page_cache import bump_content_version
+
+
+class Command(BaseCommand):
+    """
+    Копирует основную базу SQLite в реплики - локальная замена репликации.
+
+    Копирование выполняется через online backup API SQLite порциями страниц,
+    поэтому идет параллельно с записью в основную базу и чтением с реплики.
+    После копирования запоминается время синхронизации (по нему роутер
+    проверяет отставание реплики) и сбрасывается кеш страниц: страницы,
+    отрисованные по отстающей реплике, не остаются в кеше.
+    """
+    help = 'Синхронизирует реплики SQLite с основной базой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Реплики (по умолчанию все из DATABASE_REPLICAS)')
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Количество страниц базы, копируемых за один шаг')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Повторять синхронизацию каждые N секунд')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or get_replicas()
+        if not aliases:
+            raise CommandError('Реплики не настроены (NEWS_DB_REPLICAS)')
+        unknown = set(aliases) - set(get_replicas())
+        if unknown:
+            raise CommandError(f"Неизвестные реплики: {', '.join(sorted(unknown))}")
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias}: синхронизация поддерживается только для SQLite')
+
+        while True:
+            for alias in aliases:
+                started = time.monotonic()
+                self.sync(alias, options['pages'])
+                self.stdout.write(f'{alias}: синхронизирована за {time.monotonic() - started:.2f} с')
+            bump_content_version()
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    @staticmethod
+    def sync(alias, pages):
+        source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+        source.ensure_connection()
+        target.ensure_connection()
+        synced_at = time.time()
+        source.connection.backup(target.connection, pages=pages)
+        mark_replica_synced(alias, synced_at)
@@ -0,0 +1,215 @@
+import asyncio
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import reverse
+
+from .routers import get_replicas, get_routing_options, replica_reads
+from .services.metrics import get_metrics, observe_request
+from .services.profiling import (build_server_timing, get_current_profile, get_profiling_options,
+                                 install_query_profiler_on_all, profile_request, report, should_sample)
+
+
+class AsyncViewsMiddleware:
+    """
+    Направляет запросы, пришедшие через ASGI, в ASYNC_URLCONF с асинхронными
+    вариантами публичных страниц. Под WSGI цепочка middleware синхронная,
+    и запросы обрабатываются синхронными представлениями по ROOT_URLCONF.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.urlconf = getattr(settings, 'ASYNC_URLCONF', None)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.urlconf:
+            request.urlconf = self.urlconf
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплик для GET/HEAD-запросов к публичным страницам.
+
+    После запроса, изменяющего данные (сохранение новости в админке, вход
+    на сайт), пользователю ставится cookie, и следующие STICKY_SECONDS секунд
+    его запросы читают основную базу: редактор сразу видит свои изменения,
+    даже если реплика еще не догнала основную базу.
+    """
+    sync_capable = True
+    async_capable = True
+    sticky_cookie = 'db_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._admin_prefix = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @property
+    def admin_prefix(self):
+        if self._admin_prefix is None:
+            self._admin_prefix = reverse('admin:index')
+        return self._admin_prefix
+
+    def use_replicas(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and self.sticky_cookie not in request.COOKIES
+            and not request.path.startswith(self.admin_prefix)
+        )
+
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and get_replicas():
+            response.set_cookie(self.sticky_cookie, '1', max_age=get_routing_options()['STICKY_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self.use_replicas(request)):
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        with replica_reads(self.use_replicas(request)):
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+
+class ServerTimingMiddleware:
+    """
+    Профилирование выборки запросов (PERFORMANCE_PROFILING['SAMPLE_RATE']):
+    количество и время SQL-запросов с местом вызова, время отрисовки шаблонов,
+    представления и всего запроса. Результат отдается в заголовке Server-Timing
+    и пишется в лог pagenew.performance. Должен стоять первым в MIDDLEWARE,
+    а ViewTimingMiddleware - последним.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def finish(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        if get_profiling_options()['SERVER_TIMING_HEADER']:
+            response.headers['Server-Timing'] = build_server_timing(profile, total)
+        report(request, response, profile, total)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_sample():
+            return self.get_response(request)
+        install_query_profiler_on_all()
+        with profile_request() as profile:
+            response = self.get_response(request)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if not should_sample():
+            return await self.get_response(request)
+        with profile_request(asyncio.current_task()) as profile:
+            response = await self.get_response(request)
+        return self.finish(request, response, profile)
+
+
+class MetricsMiddleware:
+    """
+    Считает для метрик /metrics время каждого запроса и его SQL-запросы по имени
+    маршрута. Должен стоять сразу после ServerTimingMiddleware и использует его
+    профиль, если запрос попал в выборку.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if get_metrics() is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        profile = get_current_profile()
+        if profile is None:
+            install_query_profiler_on_all()
+            with profile_request(attribute=False) as profile:
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        observe_request(request, response, time.perf_counter() - started, profile)
+        return response
+
+    async def __acall__(self, request):
+        if get_metrics() is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        profile = get_current_profile()
+        if profile is None:
+            with profile_request(attribute=False) as profile:
+                response = await self.get_response(request)
+        else:
+            response = await self.get_response(request)
+        observe_request(request, response, time.perf_counter() - started, profile)
+        return response
+
+
+class ViewTimingMiddleware:
+    """ Измеряет время представления (вместе с его запросами и отрисовкой) для ServerTimingMiddleware. """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = get_current_profile()
+        if profile is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        if hasattr(response, 'render') and not response.is_rendered:
+            # TemplateResponse отрисовывается уже после представления
+            response.add_post_render_callback(lambda _: self.stop(profile, started))
+        else:
+            self.stop(profile, started)
+        return response
+
+    async def __acall__(self, request):
+        profile = get_current_profile()
+        if profile is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.add_post_render_callback(lambda _: self.stop(profile, started))
+        else:
+            self.stop(profile, started)
+        return response
+
+    @staticmethod
+    def stop(profile, started):
+        profile.view_time = time.perf_counter() - started
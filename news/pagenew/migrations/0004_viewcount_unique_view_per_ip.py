@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_views(apps, schema_editor):
+    ViewCount = apps.get_model('pagenew', 'ViewCount')
+    keep_ids = (
+        ViewCount.objects.values('new', 'ip_address')
+        .annotate(keep_id=Min('id'))
+        .values('keep_id')
+    )
+    ViewCount.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0003_viewcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_views, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='viewcount',
+            constraint=models.UniqueConstraint(fields=('new', 'ip_address'), name='unique_view_per_ip'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def fill_view_counters(apps, schema_editor):
+    New = apps.get_model('pagenew', 'New')
+    ViewCount = apps.get_model('pagenew', 'ViewCount')
+    views = (
+        ViewCount.objects.filter(new=OuterRef('pk'))
+        .values('new').annotate(total=Count('id')).values('total')
+    )
+    New.objects.filter(views__isnull=False).distinct().update(
+        unique_views=Subquery(views), total_views=Subquery(views),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0004_viewcount_unique_view_per_ip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='new',
+            name='total_views',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Всего просмотров'),
+        ),
+        migrations.AddField(
+            model_name='new',
+            name='unique_views',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Уникальных просмотров'),
+        ),
+        migrations.RunPython(fill_view_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0005_new_view_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='new',
+            name='views_sketch',
+            field=models.BinaryField(blank=True, null=True, verbose_name='HyperLogLog уникальных посетителей'),
+        ),
+        migrations.CreateModel(
+            name='ViewSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('sketch', models.BinaryField(verbose_name='HyperLogLog')),
+                ('new', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sketches', to='pagenew.new')),
+            ],
+            options={
+                'verbose_name': 'Счетчик уникальных посетителей',
+                'verbose_name_plural': 'Счетчики уникальных посетителей',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='viewsketch',
+            constraint=models.UniqueConstraint(fields=('new', 'day'), name='unique_sketch_per_day'),
+        ),
+    ]
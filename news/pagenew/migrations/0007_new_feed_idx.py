@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0006_viewsketch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='new',
+            index=models.Index(fields=['-date_of_create', '-id'], name='new_feed_idx'),
+        ),
+    ]
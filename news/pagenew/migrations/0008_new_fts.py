@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS pagenew_new_fts USING fts5("
+        "title, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    New = apps.get_model('pagenew', 'New')
+    rows = New.objects.filter(is_archived=False).values_list('id', 'title', 'description')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO pagenew_new_fts (rowid, title, description) VALUES (%s, %s, %s)', list(rows)
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS pagenew_new_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0007_new_feed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_date_of_create(apps, schema_editor):
+    New = apps.get_model('pagenew', 'New')
+    New.objects.filter(date_of_create__isnull=False).update(updated_at=F('date_of_create'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0008_new_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='new',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения новости'),
+        ),
+        migrations.RunPython(copy_date_of_create, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0009_new_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные копии'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:42
+
+import django.core.validators
+import pagenew.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0010_picture_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='picture',
+            name='path',
+            field=models.FileField(db_index=True, storage=pagenew.storage.get_picture_storage, upload_to='static/img/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'], 'Только изображения форматов jpg, jpeg, png допустимы.')], verbose_name='Изображение'),
+        ),
+    ]
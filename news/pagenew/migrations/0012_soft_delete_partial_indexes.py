@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0011_picture_content_addressed'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='new',
+            name='new_feed_idx',
+        ),
+        migrations.AddIndex(
+            model_name='new',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['-date_of_create', '-id'], name='new_active_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='picture',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['new'], name='picture_active_new_idx'),
+        ),
+    ]
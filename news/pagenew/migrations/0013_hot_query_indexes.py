@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0012_soft_delete_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='picture',
+            name='picture_active_new_idx',
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('unique_ips', models.PositiveIntegerField(default=0, verbose_name='Уникальные IP')),
+                ('compacted', models.BooleanField(default=False, verbose_name='Исходные записи удалены')),
+                ('new', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='pagenew.new')),
+            ],
+            options={
+                'verbose_name': 'Просмотры за день',
+                'verbose_name_plural': 'Просмотры по дням',
+                'indexes': [models.Index(fields=['day'], name='view_daily_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='viewdailyaggregate',
+            constraint=models.UniqueConstraint(fields=('new', 'day'), name='unique_aggregate_per_day'),
+        ),
+    ]
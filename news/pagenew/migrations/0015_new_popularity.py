@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-17 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0014_viewdailyaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='new',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Оценка популярности'),
+        ),
+        migrations.AddIndex(
+            model_name='new',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['-trending_score', '-id'], name='new_active_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='new',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['-total_views', '-id'], name='new_active_top_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0015_new_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='new',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Анонс'),
+        ),
+        migrations.AddField(
+            model_name='new',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество слов'),
+        ),
+    ]
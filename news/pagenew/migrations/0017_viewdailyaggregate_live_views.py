@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-17 08:44
+
+from django.db import migrations, models
+
+
+def clear_rolled_up_views(apps, schema_editor):
+    # прежние сводки строились по ViewCount, где хранится только первое посещение,
+    # поэтому в views было число новых IP, а не просмотров
+    ViewDailyAggregate = apps.get_model('pagenew', 'ViewDailyAggregate')
+    ViewDailyAggregate.objects.update(views=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagenew', '0016_new_excerpt'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='viewdailyaggregate',
+            name='unique_ips',
+            field=models.PositiveIntegerField(default=0, verbose_name='Новые уникальные IP'),
+        ),
+        migrations.AlterField(
+            model_name='viewdailyaggregate',
+            name='views',
+            field=models.PositiveIntegerField(blank=True, default=0, null=True, verbose_name='Просмотры'),
+        ),
+        migrations.RunPython(clear_rolled_up_views, migrations.RunPython.noop),
+    ]
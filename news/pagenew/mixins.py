@@ -1,5 +1,34 @@
-from .models import ViewCount
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .services.metrics import observe_cache
+from .services.page_cache import (build_page_key, get_cache_query, get_hole_placeholders,
+                                  get_page_cache, get_page_version, punch_holes)
 from .services.utils import get_client_ip
+from .services.view_recorder import get_view_recorder
+
+
+def build_validators(request, etag_source, last_modified):
+    """
+    Возвращает (ETag, Last-Modified в секундах) страницы. ETag учитывает адрес
+    страницы и пользователя, так как навигация на странице зависит от него.
+    """
+    user_id = request.session.get('_auth_user_id', '')
+    etag = quote_etag(hashlib.md5(f'{etag_source}:{request.get_full_path()}:{user_id}'.encode()).hexdigest())
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def set_validators(response, etag, last_modified):
+    """ Добавляет валидаторы к успешному ответу. """
+    if response.status_code == 200:
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        patch_vary_headers(response, ('Cookie',))
+    return response
 
 
 class ViewCountMixin:
@@ -9,8 +38,99 @@ class ViewCountMixin:
     def get_object(self):
         # получаем статью из метода родительского класса
         obj = super().get_object()
+        self.record_view(obj.pk)
+        return obj
+
+    def record_view(self, pk):
         # получаем IP-адрес пользователя
         ip_address = get_client_ip(self.request)
-        # получаем или создаем запись о просмотре статьи для данного пользователя
-        ViewCount.objects.get_or_create(new=obj, ip_address=ip_address)
-        return obj
\ No newline at end of file
+        # ставим просмотр в очередь, запись в базу выполняется пачками
+        get_view_recorder().record(pk, ip_address)
+
+
+
+class CachedPageMixin:
+    """
+    Миксин для кеширования отрисованной страницы целиком.
+
+    Страница кешируется без зависящих от пользователя фрагментов (навигация,
+    ссылка на админ-панель): вместо них в ней остаются метки, а сами фрагменты
+    отрисовываются для каждого пользователя отдельно и подставляются при отдаче. Ключ кеша содержит поколение контента, которое меняется
+    при сохранении новостей и изображений, поэтому закешированная страница
+    отдается без обращений к базе (кроме сессии авторизованного пользователя).
+    Вместе со страницей хранятся ее валидаторы (ConditionalPageMixin), чтобы
+    и их не вычислять запросом. Из параметров запроса в ключ входят только
+    перечисленные в page_cache_params.
+    """
+    page_cache_timeout = 600
+    page_cache_params = ()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['page_cache_holes'] = get_hole_placeholders()
+        context['news_version'] = self.content_version
+        return context
+
+    def on_cache_hit(self, request, *args, **kwargs):
+        """ Вызывается, когда страница отдана из кеша. """
+
+    def get_cached_page(self, request):
+        """ Закешированная страница {'html', 'validators'} или None; кеш читается один раз за запрос. """
+        if not hasattr(self, 'page_cache_key'):
+            self.content_version = get_page_version()
+            self.page_cache_key = build_page_key(request, self.content_version,
+                                                 get_cache_query(request, self.page_cache_params))
+            self.cached_page = get_page_cache().get(self.page_cache_key)
+            observe_cache('page', self.cached_page is not None)
+        return self.cached_page
+
+    def get_cached_validators(self, request, *args, **kwargs):
+        page = self.get_cached_page(request)
+        return page['validators'] if page else None
+
+    def get(self, request, *args, **kwargs):
+        page = self.get_cached_page(request)
+        if page is None:
+            response = super().get(request, *args, **kwargs)
+            response.render()
+            if response.status_code != 200:
+                return response
+            page = {'html': response.content.decode(response.charset), 'validators': getattr(self, 'validators', None)}
+            get_page_cache().set(self.page_cache_key, page, self.page_cache_timeout)
+        else:
+            self.on_cache_hit(request, *args, **kwargs)
+        return HttpResponse(punch_holes(page['html'], request))
+
+
+
+class ConditionalPageMixin:
+    """
+    Миксин для условных GET-запросов (ETag / Last-Modified / 304).
+
+    Валидаторы вычисляются дешевым запросом без отрисовки шаблона в get_validators,
+    который возвращает строку-источник ETag и дату последнего изменения.
+    ETag учитывает пользователя, так как навигация на странице зависит от него.
+    Если представление кеширует страницу вместе с валидаторами (get_cached_validators),
+    для закешированной страницы запрос не выполняется.
+    """
+    def get_validators(self, request, *args, **kwargs):
+        """ Возвращает (источник ETag, дата изменения) или None, если валидаторов нет. """
+        raise NotImplementedError
+
+    def on_not_modified(self, request, *args, **kwargs):
+        """ Вызывается перед ответом 304. """
+
+    def get(self, request, *args, **kwargs):
+        get_cached_validators = getattr(self, 'get_cached_validators', None)
+        validators = get_cached_validators(request, *args, **kwargs) if get_cached_validators else None
+        if validators is None:
+            validators = self.validators = self.get_validators(request, *args, **kwargs)
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        etag, last_modified = build_validators(request, *validators)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            if response.status_code == 304:
+                self.on_not_modified(request, *args, **kwargs)
+            return response
+        return set_validators(super().get(request, *args, **kwargs), etag, last_modified)
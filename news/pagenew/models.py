@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Count
 from django.urls import reverse
 from django.core.exceptions import ValidationError
@@ -11,6 +11,41 @@ from datetime import date
 from django.contrib.auth.hashers import make_password, is_password_usable
 from django.utils.translation import gettext_lazy as _
 from django.utils.formats import date_format
+from .storage import get_picture_storage
+from .services.roles import clear_role_cache, get_or_create_role
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    """
+    Набор запросов для моделей с мягким удалением (поле is_archived).
+
+    Методы:
+    - active: Возвращает только неархивные записи.
+    - archived: Возвращает только архивные записи.
+    - archive: Архивирует все записи набора одним UPDATE без вызова save() для каждой.
+    """
+    def active(self):
+        return self.filter(is_archived=False)
+
+    def archived(self):
+        return self.filter(is_archived=True)
+
+    def get_archive_updates(self):
+        """ Дополнительные поля, которые меняются при архивации. """
+        return {}
+
+    def archive(self):
+        """ Архивирует записи одним запросом и возвращает количество архивированных. """
+        return self.filter(is_archived=False).update(is_archived=True, **self.get_archive_updates())
+
+
+class RoleQuerySet(SoftDeleteQuerySet):
+    """ Набор запросов ролей: архивация сбрасывает кеш ролей процесса. """
+    def archive(self):
+        archived = super().archive()
+        transaction.on_commit(clear_role_cache)
+        return archived
+
 
 class Role(models.Model):
     """
@@ -40,6 +75,8 @@ class Role(models.Model):
 
     is_archived = models.BooleanField(default=False, verbose_name="Архивирован")
 
+    objects = RoleQuerySet.as_manager()
+
     def delete(self, *args, **kwargs):
         """ Переопределяет метод удаления, помечая объект как архивированный вместо удаления. """
         self.is_archived = True
@@ -55,7 +92,13 @@ class Role(models.Model):
         verbose_name_plural = "Роли"
 
 
-class UserManager(BaseUserManager):
+class UserQuerySet(SoftDeleteQuerySet):
+    """ Набор запросов пользователей: архивированный пользователь становится неактивным. """
+    def get_archive_updates(self):
+        return {'is_active': False}
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """
        Менеджер пользовательских моделей, предоставляющий методы для создания пользователей и суперпользователей.
 
@@ -80,7 +123,7 @@ class UserManager(BaseUserManager):
         if login is None:
             raise ValueError('Введите логин')
         if role is None:
-            user_role, created = Role.objects.get_or_create(title='Клиент')
+            user_role = get_or_create_role('Клиент')
             role = user_role
         user = self.model(
             email=self.normalize_email(email),
@@ -114,7 +157,7 @@ class UserManager(BaseUserManager):
         if login is None:
             raise ValueError('Введите логин')
         if role is None:
-            user_role, created = Role.objects.get_or_create(title='Администратор')
+            user_role = get_or_create_role('Администратор')
             role = user_role
         user = self.create_user(
             email=self.normalize_email(email),
@@ -204,7 +247,7 @@ class User(AbstractBaseUser, PermissionsMixin):
             if self.pk:
                 old_password = User.objects.get(pk=self.pk).password
                 self.password = old_password
-            user_role, created = Role.objects.get_or_create(title='Клиент')
+            user_role = get_or_create_role('Клиент')
             self.role = user_role
         if self.pk and not is_password_usable(self.password):
             self.password = make_password(self.password)
@@ -222,6 +265,75 @@ class User(AbstractBaseUser, PermissionsMixin):
         return f"{self.name} {self.login} {archived_status}"
 
 
+# поля New, которые нужны карточке новости в списках (date_of_create и id - еще и курсору ленты)
+CARD_FIELDS = ('id', 'title', 'date_of_create', 'excerpt', 'word_count')
+
+
+class NewQuerySet(SoftDeleteQuerySet):
+    """
+    Набор запросов для новостей.
+
+    Методы:
+    - archive: Архивирует новости вместе с их изображениями и убирает их из поиска и кеша.
+    - for_listing: Подгружает автора и неархивные изображения фиксированным числом запросов.
+    - for_cards: Как for_listing, но только с полями карточки, без полного текста.
+    - for_feed: Поля карточки вместе с автором для лент новостей.
+    - last_change: Возвращает дату последнего изменения новостей.
+    """
+    def for_listing(self):
+        """
+        Возвращает новости вместе с автором (JOIN) и неархивными изображениями
+        (один дополнительный запрос на всю выборку) для вывода карточек.
+        """
+        return self.select_related('author').defer('views_sketch').prefetch_related(
+            models.Prefetch('picture_set', queryset=Picture.objects.active().order_by('new', 'id'))
+        )
+
+    def for_cards(self):
+        """
+        Новости для карточек списков: читаются только поля, которые выводит
+        news_card.html, вместо описания - анонс; полный текст карточка
+        загружает по запросу (NewTextView). Изображения подгружаются как в for_listing.
+        """
+        return self.only(*CARD_FIELDS).prefetch_related(
+            models.Prefetch('picture_set', queryset=Picture.objects.active().order_by('new', 'id'))
+        )
+
+    def for_feed(self):
+        """ Новости для RSS/Atom/JSON-лент: поля карточки, дата изменения и имя автора. """
+        return self.for_cards().select_related('author').only(*CARD_FIELDS, 'updated_at', 'author__name')
+
+    def last_change(self):
+        """
+        Возвращает дату последнего изменения новостей одним поиском по индексу updated_at.
+        Новости не удаляются физически (архивация меняет updated_at), поэтому этого
+        достаточно для ETag/Last-Modified без отрисовки страниц.
+        """
+        return self.aggregate(last_modified=models.Max('updated_at'))['last_modified']
+
+    def get_archive_updates(self):
+        return {'updated_at': timezone.now()}
+
+    def archive(self):
+        from .services.page_cache import bump_content_version
+        from .services.search import remove_news
+
+        targets = self.active()
+        with transaction.atomic():
+            new_ids = list(targets.values_list('id', flat=True))
+            if not new_ids:
+                return 0
+            Picture.objects.filter(new__in=targets.values('id')).update(is_archived=True)
+            archived = New.objects.filter(is_archived=False, id__in=targets.values('id')).update(
+                is_archived=True, **self.get_archive_updates()
+            )
+            remove_news(new_ids)
+            # поколение кеша меняется только после фиксации, иначе параллельный запрос
+            # закешировал бы еще не архивированные новости под новым поколением
+            transaction.on_commit(bump_content_version)
+        return archived
+
+
 class New(models.Model):
     title = models.TextField(
         verbose_name=_('Название'),
@@ -243,18 +355,47 @@ class New(models.Model):
         verbose_name=_('Автор')
     )
     date_of_create = models.DateTimeField(editable=False, null=True, blank=True, verbose_name='Дата создания новости')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения новости')
     is_archived = models.BooleanField(default=False, verbose_name="Архивирован")
+    total_views = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Всего просмотров')
+    unique_views = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Уникальных просмотров')
+    trending_score = models.FloatField(default=0, editable=False, verbose_name='Оценка популярности')
+    views_sketch = models.BinaryField(null=True, blank=True, editable=False,
+                                      verbose_name='HyperLogLog уникальных посетителей')
+    excerpt = models.TextField(blank=True, default='', editable=False, verbose_name='Анонс')
+    word_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество слов')
+
+    objects = NewQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
         if not self.date_of_create:
             self.date_of_create = timezone.localtime(timezone.now())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'description' in update_fields:
+            self.fill_excerpt()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt', 'word_count'}
 
         super(New, self).save(*args, **kwargs)
 
+    def fill_excerpt(self):
+        """ Заполняет анонс и количество слов по описанию (при сохранении и при bulk_create). """
+        from .services.excerpts import make_excerpt
+
+        self.excerpt, self.word_count = make_excerpt(self.description)
+
+    @property
+    def has_more_text(self):
+        """ Описание длиннее анонса, и его полный текст можно загрузить отдельно. """
+        from .services.excerpts import EXCERPT_WORDS
+
+        return self.word_count > EXCERPT_WORDS
+
     def delete(self, *args, **kwargs):
-        """ Переопределяет метод удаления, помечая объект как архивированный вместо удаления. """
+        """ Переопределяет метод удаления, помечая объект и его изображения как архивированные. """
         self.is_archived = True
         self.save()
+        Picture.objects.filter(new=self).archive()
 
     def __str__(self):
         """ Возвращает строковое представление объекта Hotel. """
@@ -264,16 +405,53 @@ class New(models.Model):
     class Meta:
         verbose_name = "Новость"
         verbose_name_plural = "Новости"
+        indexes = [
+            models.Index(fields=['-date_of_create', '-id'], name='new_active_feed_idx',
+                         condition=models.Q(is_archived=False)),
+            models.Index(fields=['-trending_score', '-id'], name='new_active_trending_idx',
+                         condition=models.Q(is_archived=False)),
+            models.Index(fields=['-total_views', '-id'], name='new_active_top_idx',
+                         condition=models.Q(is_archived=False)),
+        ]
 
     def get_view_count(self):
         """
-        Возвращает количество просмотров для данной статьи
+        Возвращает количество просмотров для данной статьи.
+        Счетчик хранится в самой статье и обновляется при записи просмотров.
         """
-        return self.views.count()
+        return self.unique_views
+
+    def get_unique_viewers(self, start, end):
+        """
+        Возвращает оценку числа уникальных посетителей статьи за период [start, end]
+        по дневным HyperLogLog-счетчикам (режим VIEW_RECORDING['UNIQUE_MODE'] = 'hll').
+        """
+        from .services.hyperloglog import HyperLogLog
+
+        merged = None
+        for data in self.sketches.filter(day__range=(start, end)).values_list('sketch', flat=True):
+            sketch = HyperLogLog.from_bytes(data)
+            merged = sketch if merged is None else merged.merge(sketch)
+        return merged.count() if merged is not None else 0
+
+
+class PictureQuerySet(SoftDeleteQuerySet):
+    """ Набор запросов изображений: архивация меняет дату изменения новостей и сбрасывает кеш страниц. """
+    def archive(self):
+        from .services.page_cache import bump_content_version
+
+        targets = self.active()
+        with transaction.atomic():
+            New.objects.filter(picture__in=targets.values('id')).update(updated_at=timezone.now())
+            archived = Picture.objects.filter(id__in=targets.values('id')).update(is_archived=True)
+            if archived:
+                transaction.on_commit(bump_content_version)
+        return archived
 
 
 class Picture(models.Model):
-    path = models.FileField(upload_to='static/img/', verbose_name="Изображение", validators=[
+    path = models.FileField(upload_to='static/img/', storage=get_picture_storage, db_index=True,
+                            verbose_name="Изображение", validators=[
         FileExtensionValidator(['jpg', 'jpeg', 'png'], 'Только изображения форматов jpg, jpeg, png допустимы.'),
     ])
     new = models.ForeignKey(
@@ -284,11 +462,47 @@ class Picture(models.Model):
         verbose_name=_('Новость')
     )
     is_archived = models.BooleanField(default=False, verbose_name="Архивирован")
+    derivatives = models.JSONField(default=dict, blank=True, editable=False,
+                                   verbose_name='Уменьшенные копии')
+
+    objects = PictureQuerySet.as_manager()
+
     def delete(self, *args, **kwargs):
         """ Переопределяет метод удаления, помечая объект как архивированный вместо удаления. """
         self.is_archived = True
         self.save()
 
+    def get_srcset(self, fmt):
+        """ Возвращает значение атрибута srcset для производных изображения в формате fmt. """
+        files = self.derivatives.get('variants', {}).get(fmt, {})
+        storage = self.path.storage
+        return ', '.join(f'{storage.url(name)} {width}w' for width, name in
+                         sorted(files.items(), key=lambda item: int(item[0])))
+
+    @property
+    def webp_srcset(self):
+        return self.get_srcset('webp')
+
+    @property
+    def avif_srcset(self):
+        return self.get_srcset('avif')
+
+    @property
+    def jpeg_srcset(self):
+        return self.get_srcset('jpeg')
+
+    @property
+    def display_name(self):
+        """ Имя в хранилище файла для атрибута src: самая крупная уменьшенная копия в JPEG или оригинал. """
+        files = self.derivatives.get('variants', {}).get('jpeg')
+        if not files:
+            return self.path.name
+        return files[max(files, key=int)]
+
+    @property
+    def display_url(self):
+        return self.path.storage.url(self.display_name)
+
     def __str__(self):
         """ Возвращает строковое представление объекта Tour. """
         archived_status = " (Архивировано)" if self.is_archived else ""
@@ -310,8 +524,57 @@ class ViewCount(models.Model):
     class Meta:
         ordering = ('-viewed_on',)
         indexes = [models.Index(fields=['-viewed_on'])]
+        constraints = [
+            models.UniqueConstraint(fields=['new', 'ip_address'], name='unique_view_per_ip'),
+        ]
         verbose_name = 'Просмотр'
         verbose_name_plural = 'Просмотры'
 
     def __str__(self):
-        return self.new.title
\ No newline at end of file
+        return self.new.title
+
+
+class ViewSketch(models.Model):
+    """
+    Дневной HyperLogLog-счетчик уникальных посетителей статьи
+    """
+    new = models.ForeignKey('New', on_delete=models.CASCADE, related_name='sketches')
+    day = models.DateField(verbose_name='День')
+    sketch = models.BinaryField(verbose_name='HyperLogLog')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['new', 'day'], name='unique_sketch_per_day'),
+        ]
+        verbose_name = 'Счетчик уникальных посетителей'
+        verbose_name_plural = 'Счетчики уникальных посетителей'
+
+    def __str__(self):
+        return f"{self.new_id} {self.day}"
+
+
+
+class ViewDailyAggregate(models.Model):
+    """
+    Просмотры статьи за день. Пишутся ViewRecorder вместе с каждой пачкой просмотров:
+    views - все просмотры за день, unique_ips - IP, впервые открывшие статью в этот день
+    (сумма unique_ips по дням равна New.unique_views). Для дней до появления сводок
+    команда rollup_views восстанавливает unique_ips по ViewCount, а views остается пустым.
+    compacted отмечает сводки архивных статей, записи ViewCount которых удалены по сроку хранения.
+    """
+    new = models.ForeignKey('New', on_delete=models.CASCADE, related_name='daily_views')
+    day = models.DateField(verbose_name='День')
+    views = models.PositiveIntegerField(null=True, blank=True, default=0, verbose_name='Просмотры')
+    unique_ips = models.PositiveIntegerField(default=0, verbose_name='Новые уникальные IP')
+    compacted = models.BooleanField(default=False, verbose_name='Исходные записи удалены')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['new', 'day'], name='unique_aggregate_per_day'),
+        ]
+        indexes = [models.Index(fields=['day'], name='view_daily_day_idx')]
+        verbose_name = 'Просмотры за день'
+        verbose_name_plural = 'Просмотры по дням'
+
+    def __str__(self):
+        return f"{self.new_id} {self.day}: {self.views}"
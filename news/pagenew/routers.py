@@ -0,0 +1,135 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLICA_ROUTING = {
+    'STICKY_SECONDS': 30,
+    'HEALTH_CHECK_INTERVAL': 5,
+    'MAX_LAG': None,
+}
+
+# чтение с реплик разрешено только там, где это включено явно (публичные GET-запросы);
+# команды, сигналы и запись просмотров в фоновом потоке всегда читают основную базу
+_replica_reads = ContextVar('replica_reads', default=False)
+
+_health = {}
+_health_lock = threading.Lock()
+_rotation = itertools.count()
+
+
+def get_routing_options():
+    return {**DEFAULT_REPLICA_ROUTING, **getattr(settings, 'REPLICA_ROUTING', {})}
+
+
+def get_replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in connections]
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """ Разрешает (или запрещает) чтение с реплик внутри блока. """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def get_read_source():
+    """ 'replica', если в текущем контексте чтение может идти с реплики, иначе 'primary'. """
+    return 'replica' if _replica_reads.get() and get_replicas() else 'primary'
+
+
+def synced_at_key(alias):
+    return f'db:replica:{alias}:synced_at'
+
+
+def mark_replica_synced(alias, timestamp=None):
+    """ Запоминает время последней синхронизации реплики (для проверки отставания). """
+    cache.set(synced_at_key(alias), timestamp or time.time(), None)
+    with _health_lock:
+        _health.pop(alias, None)
+
+
+def check_replica(alias):
+    """
+    Реплика здорова, если к ней можно выполнить запрос и она отстает от основной
+    базы не больше MAX_LAG секунд (по времени последней синхронизации).
+    """
+    max_lag = get_routing_options()['MAX_LAG']
+    if max_lag is not None:
+        synced_at = cache.get(synced_at_key(alias))
+        if synced_at is None or time.time() - synced_at > max_lag:
+            return False
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна, чтение переключено на основную базу', alias, exc_info=True)
+        return False
+    return True
+
+
+def is_replica_healthy(alias):
+    """ Результат check_replica, кешируемый в процессе на HEALTH_CHECK_INTERVAL секунд. """
+    interval = get_routing_options()['HEALTH_CHECK_INTERVAL']
+    now = time.monotonic()
+    with _health_lock:
+        checked_at, healthy = _health.get(alias, (None, False))
+    if checked_at is None or now - checked_at > interval:
+        healthy = check_replica(alias)
+        with _health_lock:
+            _health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    """ Выбирает здоровую реплику по кругу; None, если здоровых реплик нет. """
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    start = next(_rotation)
+    for offset in range(len(replicas)):
+        alias = replicas[(start + offset) % len(replicas)]
+        if is_replica_healthy(alias):
+            return alias
+    return None
+
+
+class PrimaryReplicaRouter:
+    """
+    Маршрутизатор основной базы и реплик.
+
+    Запись всегда идет в основную базу. Чтение уходит на реплику, только если
+    оно разрешено в текущем контексте (ReplicaRoutingMiddleware включает его
+    для публичных GET-запросов без отметки о недавнем изменении данных),
+    выполняется вне транзакции и есть здоровая реплика. Иначе используется основная база.
+    """
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема и данные реплик копируются с основной базы
+        if db in get_replicas():
+            return False
+        return None
@@ -0,0 +1,212 @@
+import asyncio
+import io
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass
+class LoadResult:
+    """ Результат нагрузочного прогона: задержки успешных ответов в секундах и число ошибок. """
+    duration: float
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def rps(self):
+        return self.requests / self.duration if self.duration else 0.0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return None
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100, method='inclusive')[percent - 1]
+
+    def summary(self):
+        """ Словарь с пропускной способностью и задержками в миллисекундах. """
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'rps': round(self.rps, 1),
+            'p50': ms(self.percentile(50)),
+            'p95': ms(self.percentile(95)),
+            'p99': ms(self.percentile(99)),
+            'max': ms(max(self.latencies)) if self.latencies else None,
+        }
+
+
+async def _read_response(reader):
+    """ Читает HTTP/1.1 ответ, возвращает (статус, закрыл ли сервер соединение). """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Сервер закрыл соединение')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def _client(host, port, paths, offset, deadline, result):
+    """ Один клиент: последовательные запросы по keep-alive соединению до deadline. """
+    loop = asyncio.get_running_loop()
+    connection = None
+    index = offset
+    while loop.time() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            reader, writer = connection
+            started = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n'.encode())
+            await writer.drain()
+            status, closed = await _read_response(reader)
+            elapsed = time.perf_counter() - started
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            result.errors += 1
+            connection = None
+            continue
+        if status >= 400:
+            result.errors += 1
+        else:
+            result.latencies.append(elapsed)
+        if closed:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def run_load(base_url, paths, duration, concurrency):
+    """
+    Нагружает сервер base_url GET-запросами к paths (по кругу) с concurrency
+    параллельными keep-alive соединениями в течение duration секунд.
+    """
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    result = LoadResult(duration=duration)
+    deadline = asyncio.get_running_loop().time() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, paths, offset, deadline, result) for offset in range(concurrency)
+    ))
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def _wsgi_environ(path, client_number):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        # у каждого клиента свой адрес, чтобы просмотры не схлопывались в один
+        'REMOTE_ADDR': f'10.255.{client_number // 256 % 256}.{client_number % 256}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def _wsgi_client(application, paths, offset, deadline, result, lock):
+    from django.db import connections
+
+    latencies = []
+    errors = 0
+    index = offset
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            started = time.perf_counter()
+            body = application(_wsgi_environ(path, offset), start_response)
+            try:
+                for _ in body:
+                    pass
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            elapsed = time.perf_counter() - started
+            if statuses.pop() >= 400:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+    finally:
+        connections.close_all()
+        with lock:
+            result.latencies.extend(latencies)
+            result.errors += errors
+
+
+def run_wsgi_load(application, paths, duration, concurrency):
+    """
+    Нагружает WSGI-приложение напрямую, без сервера и сети: concurrency потоков
+    в течение duration секунд вызывают application для paths (по кругу).
+    Измеряется обработка запроса Django целиком, включая middleware и отрисовку;
+    потоки делят GIL, как потоки одного воркера gunicorn --threads.
+    """
+    result = LoadResult(duration=duration)
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=_wsgi_client, args=(application, paths, offset, deadline, result, lock))
+        for offset in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def wait_for_port(host, port, timeout=30):
+    """ Ждет, пока сервер начнет принимать соединения. """
+    import socket
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
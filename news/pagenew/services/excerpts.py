@@ -0,0 +1,23 @@
+import re
+
+from django.utils.html import strip_tags
+
+EXCERPT_WORDS = 40
+WORD_RE = re.compile(r'\S+')
+
+
+def plain_text(text):
+    """ Текст без HTML-тегов и с одиночными пробелами между словами. """
+    return ' '.join(WORD_RE.findall(strip_tags(text or '')))
+
+
+def make_excerpt(text, words=EXCERPT_WORDS):
+    """
+    Возвращает (анонс, количество слов) текста: первые words слов без разметки,
+    с многоточием, если текст длиннее анонса.
+    """
+    all_words = plain_text(text).split()
+    excerpt = ' '.join(all_words[:words])
+    if len(all_words) > words:
+        excerpt += '…'
+    return excerpt, len(all_words)
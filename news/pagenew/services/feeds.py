@@ -0,0 +1,194 @@
+import json
+import mimetypes
+from datetime import datetime, timezone as dt_timezone
+
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.feedgenerator import Atom1Feed, Enclosure, Rss201rev2Feed
+
+from ..models import New
+from .pagination import CursorPaginator
+
+FEED_TITLE = 'Новости'
+FEED_DESCRIPTION = 'Последние новости'
+FEED_LIMIT = 20
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+JSON_FEED_CONTENT_TYPE = 'application/feed+json; charset=utf-8'
+
+
+class NewsRssFeed(Rss201rev2Feed):
+    """ RSS 2.0 со ссылкой на следующую страницу (atom:link rel="next", RFC 5005). """
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        if self.feed.get('next_url'):
+            handler.addQuickElement('atom:link', None, {'rel': 'next', 'href': self.feed['next_url']})
+
+
+class NewsAtomFeed(Atom1Feed):
+    """ Atom 1.0 со ссылкой на следующую страницу (RFC 5005). """
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        if self.feed.get('next_url'):
+            handler.addQuickElement('link', '', {'rel': 'next', 'href': self.feed['next_url']})
+
+
+XML_FEEDS = {'rss': NewsRssFeed, 'atom': NewsAtomFeed}
+
+
+def parse_since(value):
+    """
+    Разбирает параметр since: дата и время ISO 8601 или unix-время в секундах.
+    Дата без часового пояса считается UTC. Возвращает None для пустого значения.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(value)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def normalize_since(since):
+    """
+    Заменяет since датой самой новой новости ленты, которая не новее since: выборка
+    от этого не меняется, а различных значений since (и записей в кеше лент) становится
+    не больше, чем новостей, даже если клиенты передают время своего прошлого опроса.
+    Возвращает None, если таких новостей нет, - тогда лента не ограничена.
+    """
+    if since is None:
+        return None
+    return (New.objects.active().order_by('-date_of_create')
+            .filter(date_of_create__lte=since).values_list('date_of_create', flat=True).first())
+
+
+def build_feed_query(since=None, cursor=None):
+    """ Параметры ленты, от которых зависит ее содержимое: ключ кеша и адреса в самой ленте. """
+    query = QueryDict(mutable=True)
+    if since is not None:
+        query['since'] = since.isoformat()
+    if cursor:
+        query['cursor'] = cursor
+    return query
+
+
+def get_feed_page(since=None, cursor=None, limit=FEED_LIMIT):
+    """
+    Страница ленты: новости новее since от новых к старым, после курсора cursor.
+    Оба условия проверяются по индексу ленты, поэтому стоимость не зависит от размера архива.
+    Неверный курсор вызывает InvalidCursor.
+    """
+    queryset = New.objects.active().for_feed()
+    if since is not None:
+        queryset = queryset.filter(date_of_create__gt=since)
+    return CursorPaginator(queryset, limit).page(cursor)
+
+
+def get_first_picture(new):
+    pictures = new.picture_set.all()
+    return pictures[0] if pictures else None
+
+
+def build_enclosure(request, picture):
+    """ Вложение с изображением: тип по расширению отдаваемого файла, длина - его размер в хранилище. """
+    name = picture.display_name
+    storage = picture.path.storage
+    try:
+        length = storage.size(name)
+    except OSError:
+        length = 0
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return Enclosure(request.build_absolute_uri(storage.url(name)), str(length), content_type)
+
+
+def build_feed_url(request, query):
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}' if query else request.path)
+
+
+def build_next_url(request, query, page):
+    if not page.has_next():
+        return None
+    query = query.copy()
+    query['cursor'] = page.next_cursor
+    return build_feed_url(request, query)
+
+
+def build_xml_feed(feed_format, request, page, query):
+    """ RSS 2.0 или Atom 1.0 по странице ленты; первое изображение новости - вложение. """
+    feed = XML_FEEDS[feed_format](
+        title=FEED_TITLE,
+        link=request.build_absolute_uri(reverse('new')),
+        description=FEED_DESCRIPTION,
+        feed_url=build_feed_url(request, query),
+        language='ru',
+        next_url=build_next_url(request, query, page),
+    )
+    for new in page.object_list:
+        link = request.build_absolute_uri(reverse('news_detail', args=[new.pk]))
+        picture = get_first_picture(new)
+        enclosures = [build_enclosure(request, picture)] if picture is not None else []
+        feed.add_item(
+            title=new.title,
+            link=link,
+            description=new.excerpt,
+            unique_id=link,
+            unique_id_is_permalink=True,
+            author_name=new.author.name if new.author else None,
+            pubdate=new.date_of_create,
+            updateddate=new.updated_at,
+            enclosures=enclosures,
+        )
+    return feed.writeString('utf-8'), feed.content_type
+
+
+def build_json_feed(request, page, query):
+    """ JSON Feed 1.1 по странице ленты. """
+    items = []
+    for new in page.object_list:
+        link = request.build_absolute_uri(reverse('news_detail', args=[new.pk]))
+        picture = get_first_picture(new)
+        item = {
+            'id': str(new.pk),
+            'url': link,
+            'title': new.title,
+            'summary': new.excerpt,
+            'content_text': new.excerpt,
+            'date_published': new.date_of_create.isoformat(),
+            'date_modified': new.updated_at.isoformat(),
+        }
+        if new.author:
+            item['authors'] = [{'name': new.author.name}]
+        if picture is not None:
+            item['image'] = request.build_absolute_uri(picture.display_url)
+        items.append(item)
+    feed = {
+        'version': JSON_FEED_VERSION,
+        'title': FEED_TITLE,
+        'description': FEED_DESCRIPTION,
+        'language': 'ru',
+        'home_page_url': request.build_absolute_uri(reverse('new')),
+        'feed_url': build_feed_url(request, query),
+        'items': items,
+    }
+    next_url = build_next_url(request, query, page)
+    if next_url is not None:
+        feed['next_url'] = next_url
+    return json.dumps(feed, ensure_ascii=False), JSON_FEED_CONTENT_TYPE
+
+
+def build_feed(feed_format, request, page, query):
+    """
+    Возвращает (текст ленты, content type) в формате rss, atom или json. Адреса
+    ленты строятся по query, а не по исходному запросу: лента попадает в кеш
+    и отдается всем запросам с теми же параметрами.
+    """
+    if feed_format == 'json':
+        return build_json_feed(request, page, query)
+    return build_xml_feed(feed_format, request, page, query)
@@ -0,0 +1,99 @@
+import hashlib
+import math
+
+
+class HyperLogLog:
+    """
+    Вероятностный счетчик уникальных значений (HyperLogLog).
+
+    Хранит 2**precision однобайтовых регистров, поэтому при погрешности 2%
+    занимает около 4 КБ независимо от количества уникальных посетителей.
+    Сериализуется в bytes (первый байт - precision, далее регистры) и
+    объединяется с другими счетчиками через merge. Счетчики разной точности
+    (например, после изменения HLL_ERROR_RATE) объединяются с меньшей из них.
+    """
+    MIN_PRECISION = 4
+    MAX_PRECISION = 16
+
+    def __init__(self, precision=12, registers=None):
+        if not self.MIN_PRECISION <= precision <= self.MAX_PRECISION:
+            raise ValueError(f'precision должна быть от {self.MIN_PRECISION} до {self.MAX_PRECISION}')
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    @classmethod
+    def for_error_rate(cls, error_rate):
+        """ Создает счетчик с точностью, достаточной для заданной относительной погрешности. """
+        size = (1.04 / error_rate) ** 2
+        precision = min(max(math.ceil(math.log2(size)), cls.MIN_PRECISION), cls.MAX_PRECISION)
+        return cls(precision)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        return cls(data[0], data[1:])
+
+    def to_bytes(self):
+        return bytes([self.precision]) + bytes(self.registers)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        x = int.from_bytes(digest, 'big')
+        index = x >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = x & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def fold(self, precision):
+        """
+        Возвращает счетчик меньшей точности с теми же значениями: такой же, какой
+        получился бы, если бы значения сразу добавлялись с точностью precision.
+        """
+        if precision > self.precision:
+            raise ValueError('Точность счетчика можно только уменьшить')
+        shift = self.precision - precision
+        mask = (1 << shift) - 1
+        folded = HyperLogLog(precision)
+        for index, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            # младшие биты старого индекса становятся старшими битами остатка хеша
+            low = index & mask
+            rank = shift - low.bit_length() + 1 if low else shift + rank
+            target = index >> shift
+            if rank > folded.registers[target]:
+                folded.registers[target] = rank
+        return folded
+
+    def merge(self, other):
+        """
+        Объединяет счетчик с другим (на месте). Если точности различаются,
+        результат получает меньшую из них.
+        """
+        precision = min(self.precision, other.precision)
+        if self.precision != precision:
+            folded = self.fold(precision)
+            self.precision, self.size, self.registers = folded.precision, folded.size, folded.registers
+        if other.precision != precision:
+            other = other.fold(precision)
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        """ Возвращает оценку количества уникальных значений. """
+        m = self.size
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def __len__(self):
+        return self.count()
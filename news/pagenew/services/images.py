@@ -0,0 +1,162 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PICTURE_DERIVATIVES = {
+    'WIDTHS': [320, 640, 1024],
+    'FORMATS': ['avif', 'webp', 'jpeg'],
+    'QUALITY': 80,
+    'DIRECTORY': 'static/img/derivatives/',
+    'WORKERS': 2,
+}
+
+# расширение файла и параметры сохранения Pillow для каждого формата
+FORMAT_OPTIONS = {
+    'jpeg': ('jpg', {'format': 'JPEG', 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'format': 'WEBP', 'method': 4}),
+    'avif': ('avif', {'format': 'AVIF'}),
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_derivative_options():
+    return {**DEFAULT_PICTURE_DERIVATIVES, **getattr(settings, 'PICTURE_DERIVATIVES', {})}
+
+
+def make_derivatives(source, output_dir, base_name, widths, formats, quality):
+    """
+    Создает уменьшенные копии изображения source во всех форматах formats для
+    каждой ширины из widths, не превышающей ширину оригинала.
+
+    Функция не обращается к базе данных и выполняется в отдельном процессе.
+    Возвращает метаданные: {'width', 'height', 'variants': {формат: {ширина: имя файла}}},
+    где имена файлов заданы относительно output_dir.
+    """
+    from PIL import Image, ImageOps, features
+
+    os.makedirs(output_dir, exist_ok=True)
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        width, height = image.size
+        targets = sorted({w for w in widths if w < width} | {min(max(widths), width)})
+        variants = {}
+        for fmt in formats:
+            if fmt not in FORMAT_OPTIONS or (fmt != 'jpeg' and not features.check(fmt)):
+                continue
+            extension, save_options = FORMAT_OPTIONS[fmt]
+            variants[fmt] = {}
+            for target in targets:
+                resized = image.resize((target, max(round(height * target / width), 1)), Image.LANCZOS)
+                if fmt == 'jpeg' and resized.mode == 'RGBA':
+                    resized = resized.convert('RGB')
+                name = f'{base_name}_{target}.{extension}'
+                resized.save(os.path.join(output_dir, name), quality=quality, **save_options)
+                variants[fmt][str(target)] = name
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def pillow_available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_job(picture):
+    """ Возвращает аргументы make_derivatives для изображения или None, если файла нет. """
+    options = get_derivative_options()
+    storage = picture.path.storage
+    if not picture.path or not storage.exists(picture.path.name):
+        return None
+    stem = os.path.splitext(os.path.basename(picture.path.name))[0]
+    # файлы с именем по хешу содержимого делят производные между всеми ссылками на них
+    is_hashed = getattr(storage, 'is_hashed_name', None)
+    base_name = stem if is_hashed and is_hashed(picture.path.name) else f'{picture.pk}_{stem}'
+    return (
+        storage.path(picture.path.name),
+        storage.path(options['DIRECTORY']),
+        base_name,
+        options['WIDTHS'],
+        options['FORMATS'],
+        options['QUALITY'],
+    )
+
+
+def save_derivatives(picture_id, source, metadata):
+    """
+    Сохраняет метаданные производных изображений (имена приводятся к именам хранилища)
+    и сбрасывает кеш страниц, чтобы карточки получили srcset.
+    """
+    from ..models import New, Picture
+    from .page_cache import bump_content_version
+
+    directory = get_derivative_options()['DIRECTORY']
+    metadata['source'] = source
+    metadata['variants'] = {
+        fmt: {width: directory + name for width, name in files.items()}
+        for fmt, files in metadata['variants'].items()
+    }
+    Picture.objects.filter(pk=picture_id).update(derivatives=metadata)
+    New.objects.filter(picture__pk=picture_id).update(updated_at=timezone.now())
+    bump_content_version()
+
+
+def needs_derivatives(picture):
+    """ Производные нужно (пере)создать, если их нет или они сделаны из другого файла. """
+    return bool(picture.path) and picture.derivatives.get('source') != picture.path.name
+
+
+def get_executor():
+    """ Пул процессов для обработки изображений, общий для процесса приложения. """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=get_derivative_options()['WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def schedule_derivatives(picture):
+    """
+    Ставит генерацию производных изображения в пул процессов; запрос
+    (например, сохранение в админке) не ждет ее окончания.
+    """
+    if not pillow_available():
+        logger.warning('Pillow не установлен, производные изображения не создаются')
+        return None
+    job = build_job(picture)
+    if job is None:
+        return None
+    picture_id, source = picture.pk, picture.path.name
+    caller = threading.get_ident()
+
+    def on_done(future):
+        try:
+            save_derivatives(picture_id, source, future.result())
+        except Exception:
+            logger.exception('Не удалось создать производные изображения %s', picture_id)
+        finally:
+            # колбэк выполняется в служебном потоке пула, его соединение больше не нужно
+            if threading.get_ident() != caller:
+                connections.close_all()
+
+    future = get_executor().submit(make_derivatives, *job)
+    future.add_done_callback(on_done)
+    return future
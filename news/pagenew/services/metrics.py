@@ -0,0 +1,133 @@
+import os
+import threading
+
+from django.conf import settings
+
+DEFAULT_METRICS = {
+    'ENABLED': True,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics_options():
+    return {**DEFAULT_METRICS, **getattr(settings, 'METRICS', {})}
+
+
+def metrics_available():
+    try:
+        import prometheus_client  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Metrics:
+    """
+    Метрики приложения в формате Prometheus (prometheus_client).
+
+    Если задана переменная окружения PROMETHEUS_MULTIPROC_DIR, значения хранятся
+    в mmap-файлах этого каталога, по файлу на процесс, и /metrics суммирует их
+    по всем воркерам gunicorn; иначе метрики считаются в памяти процесса.
+    prometheus_client читает переменную при импорте, поэтому ее задает окружение
+    процесса до запуска приложения, а не настройки Django. Каталог должен очищаться
+    при запуске сервера (см. news/gunicorn.conf.py).
+    """
+    def __init__(self, options):
+        from prometheus_client import Counter, Gauge, Histogram
+
+        self.multiprocess = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+        self.request_duration = Histogram(
+            'news_http_request_duration_seconds', 'Время обработки запроса',
+            ['view', 'method'], buckets=options['LATENCY_BUCKETS'],
+        )
+        self.requests = Counter('news_http_requests', 'Обработанные запросы', ['view', 'method', 'status'])
+        self.db_queries = Counter('news_db_queries', 'SQL-запросы', ['view'])
+        self.db_query_time = Counter('news_db_query_seconds', 'Время SQL-запросов', ['view'])
+        self.views_recorded = Counter('news_views_recorded', 'Просмотры, поставленные в очередь')
+        self.views_flushed = Counter('news_views_flushed', 'Просмотры, записанные в базу')
+        self.view_flush_duration = Histogram(
+            'news_view_flush_duration_seconds', 'Время записи пачки просмотров',
+            buckets=options['LATENCY_BUCKETS'],
+        )
+        self.view_queue_depth = Gauge(
+            'news_view_queue_depth', 'Просмотры в очереди на запись', multiprocess_mode='livesum',
+        )
+        self.cache_requests = Counter('news_cache_requests', 'Обращения к кешам', ['cache', 'result'])
+
+    def render(self):
+        """ Возвращает (текст метрик, content type). """
+        from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+        if self.multiprocess:
+            from prometheus_client import multiprocess
+
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def get_metrics():
+    """ Общий для процесса экземпляр Metrics или None, если метрики выключены или нет prometheus_client. """
+    global _metrics
+    if _metrics is None:
+        options = get_metrics_options()
+        if not options['ENABLED'] or not metrics_available():
+            return None
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(options)
+    return _metrics
+
+
+def get_view_label(request):
+    """ Имя маршрута запроса для меток: home, new, news_detail..., admin для админ-панели. """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    if 'admin' in match.namespaces:
+        return 'admin'
+    return match.url_name or 'other'
+
+
+def observe_request(request, response, duration, profile=None):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    view = get_view_label(request)
+    metrics.request_duration.labels(view, request.method).observe(duration)
+    metrics.requests.labels(view, request.method, str(response.status_code)).inc()
+    if profile is not None:
+        metrics.db_queries.labels(view).inc(len(profile.queries))
+        metrics.db_query_time.labels(view).inc(profile.query_time)
+
+
+def observe_views_recorded(count=1, queue_depth=None):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.views_recorded.inc(count)
+    if queue_depth is not None:
+        metrics.view_queue_depth.set(queue_depth)
+
+
+def observe_views_flushed(count, duration, queue_depth=None):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.views_flushed.inc(count)
+    metrics.view_flush_duration.observe(duration)
+    if queue_depth is not None:
+        metrics.view_queue_depth.set(queue_depth)
+
+
+def observe_cache(cache_name, hit):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.cache_requests.labels(cache_name, 'hit' if hit else 'miss').inc()
@@ -0,0 +1,98 @@
+import time
+
+from django.core.cache import caches
+from django.http import QueryDict
+from django.template.loader import render_to_string
+
+from ..routers import get_read_source
+
+# фрагменты, зависящие от пользователя: в кеш попадает метка, фрагмент отрисовывается при отдаче
+PAGE_CACHE_HOLES = {
+    'nav': 'nav.html',
+    'footer_admin': 'footer_admin.html',
+}
+VERSION_KEY = 'news:content_version'
+
+
+def get_page_cache():
+    return caches['default']
+
+
+def get_content_version():
+    """
+    Возвращает текущее поколение контента новостей. Оно входит в ключи
+    кешированных страниц и фрагментов, поэтому смена поколения сразу
+    делает устаревшими все закешированные страницы.
+    """
+    page_cache = get_page_cache()
+    version = page_cache.get(VERSION_KEY)
+    if version is None:
+        # после вытеснения ключа нельзя начинать с уже использованных значений
+        version = time.time_ns()
+        page_cache.add(VERSION_KEY, version, None)
+        version = page_cache.get(VERSION_KEY, version)
+    return version
+
+
+async def aget_content_version():
+    """ Асинхронный вариант get_content_version. """
+    page_cache = get_page_cache()
+    version = await page_cache.aget(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        await page_cache.aadd(VERSION_KEY, version, None)
+        version = await page_cache.aget(VERSION_KEY, version)
+    return version
+
+
+def get_page_version():
+    """
+    Версия для ключей кеша страниц и карточек новостей: поколение контента и
+    источник чтения. Страницы, отрисованные по реплике, которая может отставать,
+    кешируются отдельно от страниц, прочитанных из основной базы.
+    """
+    return f'{get_content_version()}-{get_read_source()}'
+
+
+async def aget_page_version():
+    return f'{await aget_content_version()}-{get_read_source()}'
+
+
+def bump_content_version():
+    """ Инвалидирует все закешированные страницы и карточки новостей. """
+    page_cache = get_page_cache()
+    try:
+        page_cache.incr(VERSION_KEY)
+    except ValueError:
+        page_cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def get_cache_query(request, params):
+    """ Параметры запроса из params, от которых зависит содержимое страницы. """
+    query = QueryDict(mutable=True)
+    for name in params:
+        if request.GET.get(name):
+            query[name] = request.GET[name]
+    return query
+
+
+def build_page_key(request, version, query=None):
+    """
+    Ключ кеша страницы. Из параметров запроса в него входит только query: иначе
+    произвольные параметры (метки рекламных кампаний, случайные значения от ботов)
+    плодили бы копии одной страницы в кеше.
+    """
+    query = query.urlencode() if query else ''
+    return f'news:page:{version}:{request.path}?{query}'
+
+
+def get_hole_placeholders():
+    return {name: f'<!--page-cache:{name}-->' for name in PAGE_CACHE_HOLES}
+
+
+def punch_holes(html, request):
+    """ Подставляет в закешированную страницу фрагменты, отрисованные для текущего пользователя. """
+    for name, placeholder in get_hole_placeholders().items():
+        if placeholder in html:
+            html = html.replace(placeholder, render_to_string(PAGE_CACHE_HOLES[name], request=request), 1)
+    return html
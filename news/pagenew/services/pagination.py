@@ -0,0 +1,147 @@
+import base64
+import binascii
+import json
+import math
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+# id в курсоре должен помещаться в INTEGER SQLite, иначе запрос упадет с OverflowError
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    """
+    Страница курсорной пагинации. Повторяет часть интерфейса django.core.paginator.Page,
+    используемую в шаблонах (object_list, has_next, has_previous, number).
+    """
+    def __init__(self, object_list, number, next_cursor, previous_cursor, estimated_pages=None):
+        self.object_list = object_list
+        self.number = number
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.estimated_pages = estimated_pages
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Курсорная (keyset) пагинация по ключу (date_of_create, id) от новых к старым.
+
+    Вместо OFFSET и COUNT(*) каждая страница выбирается условием
+    (date_of_create, id) < (последний показанный ключ) по индексу, поэтому стоимость
+    страницы не зависит от ее глубины. Курсоры непрозрачны для клиента: это
+    base64 от ключа, направления и номера страницы.
+
+    estimate_pages=True добавляет в страницу примерное количество страниц:
+    COUNT(*) выполняется не чаще одного раза в estimate_timeout секунд и кешируется.
+    Записи с пустой date_of_create в ленту не попадают (New.save всегда заполняет поле).
+    """
+    def __init__(self, queryset, per_page, estimate_pages=False, estimate_timeout=300,
+                 estimate_cache_key='cursor_paginator_count'):
+        self.queryset = queryset.filter(date_of_create__isnull=False)
+        self.per_page = per_page
+        self.estimate_pages = estimate_pages
+        self.estimate_timeout = estimate_timeout
+        self.estimate_cache_key = estimate_cache_key
+
+    @staticmethod
+    def encode_cursor(obj, direction, number):
+        payload = json.dumps([obj.date_of_create.isoformat(), obj.pk, direction, number])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            date_value, pk, direction, number = json.loads(base64.urlsafe_b64decode(padded))
+            date_of_create = parse_datetime(date_value)
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursor(cursor)
+        if date_of_create is None or direction not in ('next', 'prev') or not isinstance(pk, int) \
+                or not 0 < pk <= MAX_ID or not isinstance(number, int) or number < 1:
+            raise InvalidCursor(cursor)
+        return date_of_create, pk, direction, number
+
+    @classmethod
+    def valid_cursor(cls, cursor):
+        """ Возвращает cursor, если он разбирается, иначе None: испорченный курсор ведет на первую страницу. """
+        if not cursor:
+            return None
+        try:
+            cls.decode_cursor(cursor)
+        except InvalidCursor:
+            return None
+        return cursor
+
+    def page(self, cursor=None):
+        """ Возвращает страницу после (или перед) курсором; без курсора - первую страницу. """
+        queryset, direction, number = self.get_page_query(cursor)
+        return self.make_page(list(queryset), direction, number, self.get_estimated_pages())
+
+    def get_page_query(self, cursor):
+        """ Возвращает (срез queryset на per_page + 1 строк, направление, номер страницы). """
+        if not cursor:
+            return self.queryset.order_by('-date_of_create', '-id')[:self.per_page + 1], None, 1
+        date_of_create, pk, direction, number = self.decode_cursor(cursor)
+        if direction == 'next':
+            queryset = self.queryset.filter(
+                Q(date_of_create__lt=date_of_create) | Q(date_of_create=date_of_create, id__lt=pk)
+            ).order_by('-date_of_create', '-id')
+        else:
+            queryset = self.queryset.filter(
+                Q(date_of_create__gt=date_of_create) | Q(date_of_create=date_of_create, id__gt=pk)
+            ).order_by('date_of_create', 'id')
+        return queryset[:self.per_page + 1], direction, number
+
+    def make_page(self, rows, direction, number, estimated_pages):
+        if direction is None:
+            has_more_before = False
+            has_more_after = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        elif direction == 'next':
+            has_more_after = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_more_before = True
+        else:
+            has_more_before = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_more_after = True
+            if not has_more_before:
+                number = 1
+
+        next_cursor = previous_cursor = None
+        if rows and has_more_after:
+            next_cursor = self.encode_cursor(rows[-1], 'next', number + 1)
+        if rows and has_more_before:
+            previous_cursor = self.encode_cursor(rows[0], 'prev', max(number - 1, 1))
+        return CursorPage(rows, number, next_cursor, previous_cursor, estimated_pages)
+
+    def get_estimated_pages(self):
+        if not self.estimate_pages:
+            return None
+        total = cache.get(self.estimate_cache_key)
+        if total is None:
+            total = self.queryset.count()
+            cache.set(self.estimate_cache_key, total, self.estimate_timeout)
+        return max(math.ceil(total / self.per_page), 1)
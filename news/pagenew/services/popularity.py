@@ -0,0 +1,44 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+# все оценки отсчитываются от общей точки, поэтому их можно сравнивать без пересчета
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+DEFAULT_HALF_LIFE_HOURS = 24
+
+
+def decay_term(hits, when=None, half_life_hours=DEFAULT_HALF_LIFE_HOURS):
+    """
+    Логарифм вклада hits просмотров в момент when:
+    ln(hits * 2 ** ((when - TRENDING_EPOCH) / half_life)).
+    """
+    when = when or timezone.now()
+    age_hours = (when - TRENDING_EPOCH).total_seconds() / 3600
+    return math.log(hits) + age_hours / half_life_hours * math.log(2)
+
+
+def trending_score_update(hits, when=None, half_life_hours=DEFAULT_HALF_LIFE_HOURS):
+    """
+    Выражение для UPDATE, добавляющее hits просмотров к New.trending_score.
+
+    Оценка хранится как логарифм суммы экспоненциально растущих весов просмотров
+    (forward decay), поэтому старые оценки не нужно пересчитывать: порядок по
+    trending_score совпадает с порядком по оценке, затухающей с периодом
+    полураспада half_life_hours. Сложение в логарифмах выполняется как
+    max(a, b) + ln(1 + exp(-|a - b|)), без переполнения.
+    """
+    term = Value(decay_term(hits, when, half_life_hours), output_field=FloatField())
+    score = F('trending_score')
+    return Greatest(score, term) + Ln(Value(1.0) + Exp(-Abs(score - term)))
+
+
+def min_trending_score(views, when=None, half_life_hours=DEFAULT_HALF_LIFE_HOURS):
+    """
+    Хранимая оценка, которая на момент when равна views «свежим» просмотрам.
+    Сравнение с ней - условие по индексу trending_score вместо пересчета
+    оценки каждой новости.
+    """
+    return decay_term(views, when, half_life_hours)
@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger('pagenew.performance')
+
+DEFAULT_PERFORMANCE_PROFILING = {
+    'SAMPLE_RATE': 0.0,
+    'QUERY_BUDGET': None,
+    'LATENCY_BUDGET_MS': None,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SERVER_TIMING_HEADER': True,
+}
+
+DJANGO_DIR = os.path.dirname(django.__file__)
+TEMPLATE_BASE_FILE = os.path.join(DJANGO_DIR, 'template', 'base.py')
+THIS_FILE = os.path.abspath(__file__)
+
+_current_profile = ContextVar('request_profile', default=None)
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_IN_LISTS = re.compile(r'IN \((?:\?|%s)(?:, (?:\?|%s))*\)')
+
+
+def get_profiling_options():
+    return {**DEFAULT_PERFORMANCE_PROFILING, **getattr(settings, 'PERFORMANCE_PROFILING', {})}
+
+
+def normalize_sql(sql):
+    """ SQL без литералов и с коротким IN (...), чтобы одинаковые запросы с разными параметрами совпадали. """
+    return SQL_IN_LISTS.sub('IN (...)', SQL_LITERALS.sub('?', sql))
+
+
+def is_project_code(code):
+    filename = code.co_filename
+    return filename.startswith(str(settings.BASE_DIR)) and filename != THIS_FILE and 'site-packages' not in filename
+
+
+def describe_frame(frame):
+    module = frame.f_globals.get('__name__', frame.f_code.co_filename)
+    return f"{module}.{getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)}:{frame.f_lineno}"
+
+
+def find_task_origin(task):
+    """
+    Самая вложенная корутина кода проекта в цепочке await задачи task. Асинхронный
+    ORM выполняет запросы в отдельном потоке, где стек корутин представления не виден.
+    """
+    origin = None
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+        if frame is not None and is_project_code(frame.f_code):
+            origin = describe_frame(frame)
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return origin
+
+
+def find_query_origin(task=None):
+    """
+    Место, вызвавшее запрос: строка шаблона (template.html:12), если запрос
+    выполнен при отрисовке, иначе ближайшая функция кода проекта (модуль.функция:строка).
+    """
+    code_origin = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'render_annotated' and code.co_filename == TEMPLATE_BASE_FILE:
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.template_name or origin.name}:{token.lineno}'
+        if code_origin is None and is_project_code(code):
+            code_origin = describe_frame(frame)
+        frame = frame.f_back
+    if code_origin is None and task is not None:
+        code_origin = find_task_origin(task)
+    return code_origin or 'unknown'
+
+
+class RequestProfile:
+    """ Измерения одного запроса: SQL-запросы с местом вызова, время отрисовки шаблонов и представления. """
+
+    def __init__(self, task=None, attribute=True):
+        self.started = time.perf_counter()
+        # задача asyncio асинхронного запроса, для поиска места вызова запросов
+        self.task = task
+        # без attribute запросы только считаются, место вызова не ищется
+        self.attribute = attribute
+        self.queries = []
+        self.render_time = 0.0
+        self.view_time = None
+
+    @property
+    def query_time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def add_query(self, sql, duration, origin):
+        self.queries.append((sql, origin, duration))
+
+    def by_origin(self):
+        """ {место вызова: [количество, время]} в порядке убывания времени. """
+        origins = defaultdict(lambda: [0, 0.0])
+        for _, origin, duration in self.queries:
+            origins[origin][0] += 1
+            origins[origin][1] += duration
+        return dict(sorted(origins.items(), key=lambda item: -item[1][1]))
+
+    def repeated_queries(self, threshold):
+        """ Одинаковые запросы из одного места, выполненные не меньше threshold раз (признак N+1). """
+        groups = defaultdict(int)
+        for sql, origin, _ in self.queries:
+            groups[(origin, normalize_sql(sql))] += 1
+        return [
+            {'origin': origin, 'sql': sql, 'count': count}
+            for (origin, sql), count in groups.items() if count >= threshold
+        ]
+
+
+def get_current_profile():
+    return _current_profile.get()
+
+
+@contextmanager
+def profile_request(task=None, attribute=True):
+    """ Делает профиль текущим для блока; запросы и отрисовка внутри блока попадают в него. """
+    profile = RequestProfile(task, attribute)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def profile_queries(execute, sql, params, many, context):
+    """ execute_wrapper: измеряет запросы, если для текущего запроса включено профилирование. """
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        origin = find_query_origin(profile.task) if profile.attribute else None
+        profile.add_query(sql, time.perf_counter() - started, origin)
+
+
+def install_query_profiler(connection):
+    if profile_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_queries)
+
+
+def install_query_profiler_on_all():
+    """ Подключает profile_queries к уже открытым соединениям текущего потока. """
+    for connection in connections.all(initialized_only=True):
+        install_query_profiler(connection)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_query_profiler(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = _current_profile.get()
+        if profile is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.render_time += time.perf_counter() - started
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """ Шаблонизатор Django, который учитывает время отрисовки в профиле текущего запроса. """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def should_sample():
+    rate = get_profiling_options()['SAMPLE_RATE']
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def build_server_timing(profile, total):
+    """ Значение заголовка Server-Timing (длительности в миллисекундах). """
+    metrics = [f'db;dur={profile.query_time * 1000:.1f};desc="{len(profile.queries)} queries"',
+               f'render;dur={profile.render_time * 1000:.1f}']
+    if profile.view_time is not None:
+        metrics.append(f'view;dur={profile.view_time * 1000:.1f}')
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def report(request, response, profile, total):
+    """
+    Пишет структурированную строку лога о запросе. Запросы, превысившие бюджет
+    числа SQL-запросов или времени ответа, либо с признаками N+1, пишутся с уровнем WARNING.
+    """
+    options = get_profiling_options()
+    over_budget = []
+    if options['QUERY_BUDGET'] is not None and len(profile.queries) > options['QUERY_BUDGET']:
+        over_budget.append('queries')
+    if options['LATENCY_BUDGET_MS'] is not None and total * 1000 > options['LATENCY_BUDGET_MS']:
+        over_budget.append('latency')
+    repeated = profile.repeated_queries(options['N_PLUS_ONE_THRESHOLD'])
+    record = {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 1),
+        'view_ms': round(profile.view_time * 1000, 1) if profile.view_time is not None else None,
+        'render_ms': round(profile.render_time * 1000, 1),
+        'db_ms': round(profile.query_time * 1000, 1),
+        'queries': len(profile.queries),
+        'queries_by_origin': {
+            origin: {'count': count, 'ms': round(duration * 1000, 1)}
+            for origin, (count, duration) in list(profile.by_origin().items())[:10]
+        },
+        'repeated_queries': repeated,
+        'over_budget': over_budget,
+    }
+    level = logging.WARNING if over_budget or repeated else logging.INFO
+    logger.log(level, json.dumps(record, ensure_ascii=False))
+    return record
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from django.core.signals import setting_changed
+
+from .metrics import observe_cache
+
+ROLE_CACHE_TIMEOUT = 300
+ROLE_FIELDS = ('id', 'title', 'is_archived')
+
+# в кеше только значения полей: каждый вызов получает свой экземпляр Role,
+# поэтому изменения роли одного пользователя не видны другим запросам и потокам
+_lock = threading.Lock()
+_roles_by_id = {}
+_roles_by_title = {}
+_roles_db = None
+_loaded_at = None
+
+
+def _load_roles():
+    global _roles_by_id, _roles_by_title, _roles_db, _loaded_at
+    from ..models import Role
+
+    queryset = Role.objects.values_list(*ROLE_FIELDS)
+    rows = list(queryset)
+    _roles_by_id = {row[0]: row for row in rows}
+    _roles_by_title = {row[1]: row for row in rows}
+    _roles_db = queryset.db
+    _loaded_at = time.monotonic()
+
+
+def _make_role(row):
+    from ..models import Role
+
+    return Role.from_db(_roles_db, ROLE_FIELDS, row) if row is not None else None
+
+
+def _ensure_loaded():
+    # таблица ролей маленькая, поэтому загружается в память процесса целиком;
+    # изменения в других процессах подхватываются не позже ROLE_CACHE_TIMEOUT
+    if _loaded_at is None or time.monotonic() - _loaded_at > ROLE_CACHE_TIMEOUT:
+        with _lock:
+            if _loaded_at is None or time.monotonic() - _loaded_at > ROLE_CACHE_TIMEOUT:
+                _load_roles()
+
+
+def get_role_by_id(pk):
+    """ Возвращает роль по id из кеша процесса или None. """
+    _ensure_loaded()
+    row = _roles_by_id.get(pk)
+    observe_cache('roles', row is not None)
+    if row is None:
+        clear_role_cache()
+        _ensure_loaded()
+        row = _roles_by_id.get(pk)
+    return _make_role(row)
+
+
+def get_role_by_title(title):
+    """ Возвращает роль по названию из кеша процесса или None. """
+    _ensure_loaded()
+    row = _roles_by_title.get(title)
+    observe_cache('roles', row is not None)
+    return _make_role(row)
+
+
+def get_or_create_role(title):
+    """ Аналог Role.objects.get_or_create(title=title)[0], обращающийся к базе только при промахе кеша. """
+    from ..models import Role
+
+    _ensure_loaded()
+    row = _roles_by_title.get(title)
+    if row is None:
+        role, created = Role.objects.get_or_create(title=title)
+        clear_role_cache()
+        return role
+    return _make_role(row)
+
+
+def clear_role_cache(**kwargs):
+    """ Сбрасывает кеш ролей (вызывается сигналами при изменении ролей и настроек). """
+    global _loaded_at
+    with _lock:
+        _loaded_at = None
+
+
+# override_settings в тестах тоже сбрасывает кеш: роли, откаченные вместе
+# с транзакцией теста, не остаются в памяти процесса
+setting_changed.connect(clear_role_cache)
@@ -0,0 +1,97 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'pagenew_new_fts'
+# маркеры подсветки, которые не встречаются в тексте новостей
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    """ Полнотекстовый индекс FTS5 есть только в SQLite. """
+    return connection.vendor == 'sqlite'
+
+
+def index_new(new):
+    """ Добавляет новость в индекс или обновляет ее; архивные новости из индекса удаляются. """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [new.pk])
+        if not new.is_archived:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)',
+                [new.pk, new.title, new.description],
+            )
+
+
+def remove_news(new_ids):
+    """ Удаляет новости с указанными id из индекса. """
+    new_ids = list(new_ids)
+    if not fts_available() or not new_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[pk] for pk in new_ids])
+
+
+def rebuild_index(queryset, chunk_size=1000):
+    """ Полностью перестраивает индекс по queryset неархивных новостей. Возвращает число статей. """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        indexed = 0
+        last_id = 0
+        while True:
+            rows = list(
+                queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'title', 'description')[:chunk_size]
+            )
+            if not rows:
+                break
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', rows
+            )
+            indexed += len(rows)
+            last_id = rows[-1][0]
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def build_match_query(query):
+    """
+    Преобразует пользовательский запрос в выражение MATCH: каждое слово
+    ищется как префикс, все слова должны встретиться (AND).
+    """
+    tokens = TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _render_highlight(text):
+    return mark_safe(
+        escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+def search_news(query, limit, offset=0):
+    """
+    Ищет новости по названию и описанию, возвращает список словарей
+    {'id', 'title', 'snippet'} в порядке релевантности (bm25, название весит больше).
+    Название и фрагмент описания приходят с подсветкой совпадений.
+    """
+    match = build_match_query(query)
+    if not match or not fts_available():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, highlight({FTS_TABLE}, 0, %s, %s), "
+            f"snippet({FTS_TABLE}, 1, %s, %s, '…', 32) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s",
+            [HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, match, limit, offset],
+        )
+        return [
+            {'id': pk, 'title': _render_highlight(title), 'snippet': _render_highlight(snippet)}
+            for pk, title, snippet in cursor.fetchall()
+        ]
@@ -0,0 +1,378 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .hyperloglog import HyperLogLog
+from .metrics import observe_views_flushed, observe_views_recorded
+from .popularity import trending_score_update
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VIEW_RECORDING = {
+    'QUEUE': 'pagenew.services.view_recorder.LocalViewQueue',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 2000,
+    'UNIQUE_MODE': 'exact',
+    'HLL_ERROR_RATE': 0.02,
+    'TRENDING_HALF_LIFE_HOURS': 24,
+}
+# пауза перед повтором после ошибки записи удваивается до этого предела, секунд
+MAX_RETRY_DELAY = 300
+# при недоступной базе в очереди хранится не больше MAX_PENDING * BACKLOG_FACTOR просмотров
+BACKLOG_FACTOR = 10
+
+
+class LocalViewQueue:
+    """
+    Очередь просмотров в памяти процесса.
+
+    Любая другая очередь (Redis, RabbitMQ и т.д.) должна предоставлять те же
+    методы put, drain и __len__ и подключается через настройку VIEW_RECORDING['QUEUE'].
+    """
+    def __init__(self):
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def drain(self, limit):
+        """ Извлекает из очереди не более limit элементов. """
+        with self._lock:
+            count = min(limit, len(self._items))
+            return [self._items.popleft() for _ in range(count)]
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ViewRecorder:
+    """
+    Буферизованная запись просмотров статей.
+
+    Просмотры складываются в очередь и записываются пачками
+    фоновым потоком: по таймеру FLUSH_INTERVAL
+    или при накоплении BATCH_SIZE записей. Если в очереди скопилось MAX_PENDING
+    просмотров, запрос сам сбрасывает буфер, поэтому при аварийном завершении
+    процесса теряется не больше MAX_PENDING просмотров за FLUSH_INTERVAL секунд.
+    FLUSH_INTERVAL = 0 отключает буферизацию (запись в том же запросе).
+
+    UNIQUE_MODE = 'exact' хранит строку ViewCount на каждую пару (статья, IP);
+    UNIQUE_MODE = 'hll' вместо этого ведет HyperLogLog-счетчики статьи и дня
+    с погрешностью HLL_ERROR_RATE.
+
+    Каждая пачка также увеличивает New.trending_score - оценку популярности,
+    затухающую с периодом полураспада TRENDING_HALF_LIFE_HOURS, и дневную
+    сводку ViewDailyAggregate статьи.
+
+    Если запись пачки не удалась (например, database is locked), ошибка пишется
+    в лог, пачка возвращается в очередь, а следующая попытка откладывается
+    с удваивающейся паузой; в это время запросы не сбрасывают буфер сами.
+    """
+    def __init__(self, queue, batch_size, flush_interval, max_pending,
+                 unique_mode='exact', hll_error_rate=0.02, trending_half_life_hours=24):
+        if unique_mode not in ('exact', 'hll'):
+            raise ImproperlyConfigured("VIEW_RECORDING['UNIQUE_MODE'] должен быть 'exact' или 'hll'")
+        self.queue = queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.unique_mode = unique_mode
+        self.hll_error_rate = hll_error_rate
+        self.trending_half_life_hours = trending_half_life_hours
+        self._flush_lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def record(self, new_id, ip_address):
+        """ Ставит просмотр статьи new_id с адреса ip_address в очередь на запись. """
+        self.queue.put((new_id, ip_address))
+        pending = len(self.queue)
+        observe_views_recorded(queue_depth=pending)
+        if self.flush_interval <= 0 or pending >= self.max_pending:
+            if not self.is_backing_off():
+                self.flush()
+            if self.flush_interval <= 0:
+                return
+        self._ensure_worker()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def is_backing_off(self):
+        """ После ошибки записи новая попытка откладывается до _retry_at. """
+        return time.monotonic() < self._retry_at
+
+    def flush(self):
+        """
+        Записывает в базу все накопленные просмотры. Возвращает количество записанных.
+        При ошибке записи пачка возвращается в очередь и сброс прекращается.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self.queue.drain(self.batch_size)
+                if not batch:
+                    break
+                started = time.perf_counter()
+                try:
+                    self.write_batch(batch)
+                except Exception:
+                    self._on_write_error(batch)
+                    break
+                self._failures = 0
+                self._retry_at = 0.0
+                observe_views_flushed(len(batch), time.perf_counter() - started, len(self.queue))
+                written += len(batch)
+        return written
+
+    def _on_write_error(self, batch):
+        self._failures += 1
+        delay = min(max(self.flush_interval, 1) * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+        self._retry_at = time.monotonic() + delay
+        if len(self.queue) + len(batch) > self.max_pending * BACKLOG_FACTOR:
+            logger.exception('Не удалось записать %s просмотров, очередь переполнена, они потеряны', len(batch))
+            return
+        logger.exception('Не удалось записать %s просмотров, повтор через %s с', len(batch), delay)
+        for item in batch:
+            self.queue.put(item)
+
+    def write_batch(self, batch):
+        """
+        Записывает пачку просмотров и увеличивает счетчики total_views/unique_views статей.
+        """
+        if self.unique_mode == 'hll':
+            self.write_sketches(batch)
+        else:
+            self.write_rows(batch)
+
+    def write_rows(self, batch):
+        """
+        Вставляет строки ViewCount пачки и считает уникальными только те пары
+        (статья, IP), которые вставила именно эта транзакция: проверка
+        существующих строк перед вставкой пропускала бы параллельную вставку
+        той же пары другим процессом, и посетитель считался бы дважды.
+        """
+        from ..models import New
+
+        with transaction.atomic():
+            unique_hits = insert_view_rows(set(batch))
+            hits = Counter(new_id for new_id, _ in batch)
+            day = timezone.localdate()
+            for new_id, count in hits.items():
+                New.objects.filter(pk=new_id).update(
+                    total_views=F('total_views') + count,
+                    unique_views=F('unique_views') + unique_hits[new_id],
+                    trending_score=self.trending_update(count),
+                )
+                add_daily_views(new_id, day, count, unique_hits[new_id])
+
+    def write_sketches(self, batch):
+        """
+        Объединяет IP пачки с HyperLogLog-счетчиками статей. Чтение, объединение и
+        запись счетчика должны идти без параллельных писателей, иначе одно из
+        объединений потеряется. Поэтому транзакция начинается с UPDATE статей:
+        он берет блокировку записи SQLite (или блокировки строк статей в PostgreSQL),
+        и счетчики читаются уже после нее. select_for_update для этого не подходит,
+        потому что в SQLite ничего не блокирует.
+        """
+        from ..models import New, ViewSketch
+
+        day = timezone.localdate()
+        visitors = {}
+        for new_id, ip_address in batch:
+            visitors.setdefault(new_id, set()).add(ip_address)
+        hits = Counter(new_id for new_id, _ in batch)
+        with transaction.atomic():
+            # id по возрастанию: два процесса блокируют строки в одном порядке
+            for new_id in sorted(hits):
+                New.objects.filter(pk=new_id).update(
+                    total_views=F('total_views') + hits[new_id],
+                    trending_score=self.trending_update(hits[new_id]),
+                )
+            sketches = dict(New.objects.filter(pk__in=visitors).values_list('id', 'views_sketch'))
+            daily_sketches = dict(
+                ViewSketch.objects.filter(new_id__in=visitors, day=day).values_list('new_id', 'sketch')
+            )
+            for new_id in sorted(sketches):
+                total = self._load_sketch(sketches[new_id])
+                daily = self._load_sketch(daily_sketches.get(new_id))
+                unique_before = total.count()
+                for ip_address in visitors[new_id]:
+                    total.add(ip_address)
+                    daily.add(ip_address)
+                if new_id in daily_sketches:
+                    ViewSketch.objects.filter(new_id=new_id, day=day).update(sketch=daily.to_bytes())
+                else:
+                    ViewSketch.objects.create(new_id=new_id, day=day, sketch=daily.to_bytes())
+                New.objects.filter(pk=new_id).update(views_sketch=total.to_bytes(), unique_views=total.count())
+                add_daily_views(new_id, day, hits[new_id], max(total.count() - unique_before, 0))
+
+    def trending_update(self, hits):
+        return trending_score_update(hits, half_life_hours=self.trending_half_life_hours)
+
+    def _load_sketch(self, data):
+        if data:
+            return HyperLogLog.from_bytes(data)
+        return HyperLogLog.for_error_rate(self.hll_error_rate)
+
+    def _worker_running(self):
+        # после fork (gunicorn --preload) поток родителя в дочернем процессе не существует
+        return self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid()
+
+    def _ensure_worker(self):
+        if self._worker_running():
+            return
+        with self._worker_lock:
+            if self._worker_running():
+                return
+            if self._worker is None:
+                atexit.register(self.flush)
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name='view-recorder', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(max(self.flush_interval, self._retry_at - time.monotonic()))
+            self._wakeup.clear()
+            if self.is_backing_off():
+                continue
+            try:
+                self.flush()
+            except Exception:
+                # поток должен пережить любую ошибку, иначе просмотры копились бы без записи
+                logger.exception('Ошибка фоновой записи просмотров')
+            finally:
+                connections.close_all()
+
+
+def insert_view_rows(pairs, batch_size=300):
+    """
+    Вставляет строки ViewCount для пар (статья, IP) через INSERT ... ON CONFLICT DO NOTHING
+    RETURNING (SQLite 3.35+, PostgreSQL). Возвращает Counter статей по действительно
+    вставленным строкам: пары, уже записанные раньше или параллельно, в него не попадают.
+    """
+    from ..models import ViewCount
+
+    opts = ViewCount._meta
+    new_field, ip_field, viewed_on_field = (opts.get_field(name) for name in ('new', 'ip_address', 'viewed_on'))
+    viewed_on = viewed_on_field.get_db_prep_save(timezone.now(), connection)
+    rows = [
+        (new_field.get_db_prep_save(new_id, connection), ip_field.get_db_prep_save(ip_address, connection), viewed_on)
+        for new_id, ip_address in pairs
+    ]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in (new_field, ip_field, viewed_on_field))
+    inserted = Counter()
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {quote_name(opts.db_table)} ({columns}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT ({quote_name(new_field.column)}, {quote_name(ip_field.column)}) DO NOTHING '
+                f'RETURNING {quote_name(new_field.column)}',
+                [value for row in chunk for value in row],
+            )
+            inserted.update(new_id for new_id, in cursor.fetchall())
+    return inserted
+
+
+def add_daily_views(new_id, day, views, unique_ips):
+    """
+    Прибавляет просмотры и новые уникальные IP к сводке статьи за день одним
+    INSERT ... ON CONFLICT DO UPDATE (SQLite 3.24+, PostgreSQL): сводку за день
+    создает первая пачка, следующие только увеличивают счетчики.
+    """
+    from ..models import ViewDailyAggregate
+
+    table = connection.ops.quote_name(ViewDailyAggregate._meta.db_table)
+    with connection.cursor() as cursor:
+        # views пуст у сводок, восстановленных по ViewCount
+        cursor.execute(
+            f'INSERT INTO {table} (new_id, day, views, unique_ips, compacted) VALUES (%s, %s, %s, %s, %s) '
+            f'ON CONFLICT (new_id, day) DO UPDATE SET '
+            f'views = COALESCE({table}.views, 0) + excluded.views, '
+            f'unique_ips = {table}.unique_ips + excluded.unique_ips',
+            [new_id, day, views, unique_ips, False],
+        )
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_view_recording_options():
+    return {**DEFAULT_VIEW_RECORDING, **getattr(settings, 'VIEW_RECORDING', {})}
+
+
+def get_view_recorder():
+    """ Возвращает общий для процесса экземпляр ViewRecorder, созданный по настройкам. """
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                options = get_view_recording_options()
+                _recorder = ViewRecorder(
+                    queue=import_string(options['QUEUE'])(),
+                    batch_size=options['BATCH_SIZE'],
+                    flush_interval=options['FLUSH_INTERVAL'],
+                    max_pending=options['MAX_PENDING'],
+                    unique_mode=options['UNIQUE_MODE'],
+                    hll_error_rate=options['HLL_ERROR_RATE'],
+                    trending_half_life_hours=options['TRENDING_HALF_LIFE_HOURS'],
+                )
+    return _recorder
+
+
+def record_view_in_background(new_id, ip_address):
+    """
+    Ставит просмотр в очередь из асинхронного кода, не дожидаясь результата.
+
+    ViewRecorder.record может обращаться к очереди и к базе (при сбросе пачки),
+    поэтому выполняется в пуле потоков цикла событий, а не в самом цикле.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, _record_view, new_id, ip_address)
+    future.add_done_callback(_log_record_error)
+    return future
+
+
+def _record_view(new_id, ip_address):
+    try:
+        get_view_recorder().record(new_id, ip_address)
+    finally:
+        # потоки пула не обрабатывают запросы, и Django сам не закроет открытые в них соединения
+        connections.close_all()
+
+
+def _log_record_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Не удалось записать просмотр', exc_info=future.exception())
+
+
+def _reset_view_recorder(setting, **kwargs):
+    global _recorder
+    if setting == 'VIEW_RECORDING' and _recorder is not None:
+        _recorder.flush()
+        _recorder = None
+
+
+setting_changed.connect(_reset_view_recorder)
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import New, Picture, Role
+from .services.images import needs_derivatives, schedule_derivatives
+from .services.page_cache import bump_content_version
+from .services.roles import clear_role_cache
+from .services.search import index_new
+
+
+@receiver(post_save, sender=New)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """ Поддерживает полнотекстовый индекс в актуальном состоянии при сохранении и архивации новости. """
+    if not raw:
+        index_new(instance)
+
+
+@receiver([post_save, post_delete], sender=New)
+@receiver([post_save, post_delete], sender=Picture)
+def invalidate_page_cache(sender, raw=False, **kwargs):
+    """
+    Сбрасывает закешированные страницы и карточки при изменении новостей и изображений.
+    Поколение меняется только после фиксации транзакции: иначе параллельный запрос
+    успел бы закешировать старые данные под новым поколением.
+    """
+    if not raw:
+        transaction.on_commit(bump_content_version)
+
+
+@receiver([post_save, post_delete], sender=Picture)
+def touch_picture_new(sender, instance, raw=False, **kwargs):
+    """ Изменение изображения меняет дату изменения новости (для ETag/Last-Modified). """
+    if not raw and instance.new_id:
+        New.objects.filter(pk=instance.new_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Picture)
+def build_picture_derivatives(sender, instance, raw=False, **kwargs):
+    """ После сохранения нового файла изображения ставит создание уменьшенных копий в фон. """
+    if not raw and not instance.is_archived and needs_derivatives(instance):
+        transaction.on_commit(lambda: schedule_derivatives(instance))
+
+
+@receiver([post_save, post_delete], sender=Role)
+def invalidate_role_cache(sender, **kwargs):
+    """ Сбрасывает кеш ролей процесса при изменении ролей. """
+    clear_role_cache()
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_PREFIX_LENGTH = 2
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, называющее файлы по SHA-256 их содержимого.
+
+    Файл upload_to/имя.jpg сохраняется как upload_to/ab/abcdef...jpg, поэтому
+    повторная загрузка того же файла не создает копию, а ссылается на уже
+    сохраненный. Содержимое файла по такому имени никогда не меняется, и его
+    URL можно кешировать бессрочно. Файлы удаляются только командой
+    gc_picture_blobs, когда на них не ссылается ни одно неархивное изображение.
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            from django.core.files import File
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        try:
+            return super().save(name, content, max_length=max_length)
+        except FileExistsError:
+            return name
+
+    def get_available_name(self, name, max_length=None):
+        # одинаковое имя означает одинаковое содержимое, суффиксы не нужны; если файл
+        # уже есть (параллельная загрузка тех же байтов), другое имя не подойдет -
+        # ошибка прерывает цикл подбора имени в FileSystemStorage._save
+        if os.path.lexists(self.path(name)):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # файл с тем же именем появился между exists() и записью: у него то же содержимое
+            return name
+
+    @staticmethod
+    def hashed_name(name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        content_hash = digest.hexdigest()
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, content_hash[:HASH_PREFIX_LENGTH], content_hash + extension)
+
+    def is_hashed_name(self, name):
+        """ Проверяет, что имя файла было получено hashed_name. """
+        prefix = posixpath.basename(posixpath.dirname(name))
+        stem = os.path.splitext(posixpath.basename(name))[0]
+        return len(stem) == 64 and prefix == stem[:HASH_PREFIX_LENGTH]
+
+
+def get_picture_storage():
+    return ContentAddressedStorage()
@@ -1,3 +1,1197 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.template import engines
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import urls
+from .routers import PrimaryReplicaRouter, replica_reads
+from .models import New, Picture, Role, User, ViewCount, ViewDailyAggregate, ViewSketch
+from .services.hyperloglog import HyperLogLog
+from .services.images import build_job, make_derivatives, pillow_available, save_derivatives
+from .services.metrics import metrics_available
+from .services.profiling import get_profiling_options, install_query_profiler_on_all, profile_request
+from .services.page_cache import get_content_version
+from .services.pagination import CursorPaginator, InvalidCursor
+from .services.popularity import min_trending_score
+from .services.search import build_match_query, fts_available, search_news
+from .services.roles import clear_role_cache, get_or_create_role, get_role_by_id
+from .services.view_recorder import LocalViewQueue, ViewRecorder
+from .storage import ContentAddressedStorage
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TEST_VIEW_RECORDING = {'FLUSH_INTERVAL': 0}
+TEST_PROFILING = {'SAMPLE_RATE': 0}
+
+
+def seed_news(count=300, authors=50, pictures_per_new=2, views_per_new=3):
+    """ Заполняет базу авторами, новостями, изображениями и просмотрами для проверки планов запросов. """
+    users = User.objects.bulk_create([
+        User(email=f'author{i}@example.com', password='!', name='Автор',
+             date_of_birth=date(1990, 1, 1), login=f'author{i}')
+        for i in range(authors)
+    ])
+    now = timezone.now()
+    News = [
+        New(title=f'Новость {i}', description=f'Описание новости {i} ' + 'слово ' * (i % 80),
+            author=users[i % authors], date_of_create=now - timedelta(minutes=i), is_archived=(i % 10 == 0))
+        for i in range(count)
+    ]
+    for new in News:
+        new.fill_excerpt()
+    News = New.objects.bulk_create(News)
+    Picture.objects.bulk_create([
+        Picture(path=f'static/img/{new.pk}_{n}.jpg', new=new, is_archived=(n == 0))
+        for new in News for n in range(pictures_per_new)
+    ])
+    ViewCount.objects.bulk_create([
+        ViewCount(new=new, ip_address=f'10.0.{new.pk % 250}.{n}')
+        for new in News for n in range(views_per_new)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return News
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def bad_plan_steps(plan):
+    """ Шаги плана с полным проходом по таблице или сортировкой во временном B-дереве. """
+    return [
+        step for step in plan
+        if 'TEMP B-TREE' in step or (step.startswith('SCAN ') and ' USING ' not in step)
+    ]
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # по три новости на одну дату: границы страниц попадают внутрь групп с одинаковым ключом
+        News = New.objects.bulk_create([
+            New(title=f'Новость {i}', description='Описание', date_of_create=now - timedelta(minutes=i // 3))
+            for i in range(11)
+        ])
+        cls.expected = [new.pk for new in sorted(News, key=lambda new: (new.date_of_create, new.pk), reverse=True)]
+
+    def setUp(self):
+        cache.clear()
+        self.paginator = CursorPaginator(New.objects.all(), 4)
+
+    def walk_forward(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_next_cursors_walk_every_row_once(self):
+        pages = self.walk_forward()
+        self.assertEqual([[new.pk for new in page] for page in pages],
+                         [self.expected[:4], self.expected[4:8], self.expected[8:]])
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertEqual([page.has_previous() for page in pages], [False, True, True])
+
+    def test_previous_cursors_walk_back_to_first_page(self):
+        last = self.walk_forward()[-1]
+        pages = [last]
+        while pages[-1].has_previous():
+            pages.append(self.paginator.page(pages[-1].previous_cursor))
+        self.assertEqual([[new.pk for new in page] for page in reversed(pages)],
+                         [self.expected[:4], self.expected[4:8], self.expected[8:]])
+        self.assertEqual([page.number for page in pages], [3, 2, 1])
+        # с первой страницы, открытой назад, снова можно идти вперед без пропусков
+        second = self.paginator.page(pages[-1].next_cursor)
+        self.assertEqual([new.pk for new in second], self.expected[4:8])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        encode = lambda payload: base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        cursor = self.paginator.page().next_cursor
+        invalid = [
+            'не-base64', '!!!', cursor[:-3], cursor[::-1], encode({'pk': 1}), encode([1, 2, 3, 4]),
+            encode(['вчера', 1, 'next', 2]), encode([timezone.now().isoformat(), 1, 'up', 2]),
+            encode([timezone.now().isoformat(), 2 ** 64, 'next', 2]),
+            encode([timezone.now().isoformat(), 1, 'next', 0]),
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        first_page = self.client.get(reverse('new')).context['news_list']
+        for value in invalid:
+            with self.subTest(cursor=value):
+                self.assertIsNone(CursorPaginator.valid_cursor(value))
+                with self.assertRaises(InvalidCursor):
+                    self.paginator.page(value)
+                response = self.client.get(reverse('new'), {'cursor': value})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['page_obj'].number, 1)
+                self.assertEqual(list(response.context['news_list']), list(first_page))
+                feed = self.client.get(reverse('news_feed_json'), {'cursor': value})
+                self.assertEqual(feed.status_code, 200)
+                self.assertEqual(int(feed.json()['items'][0]['id']), self.expected[0])
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class HotQueryPlanTests(TestCase):
+    """
+    Проверяет по EXPLAIN QUERY PLAN, что запросы публичных страниц новостей
+    используют индексы, а не полный проход по таблице или временную сортировку.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.news = seed_news()
+
+    def setUp(self):
+        cache.clear()
+        # оценка числа страниц ленты кешируется и не входит в горячий путь
+        cache.set('news_feed_count', len(self.news))
+
+    def assertIndexedQueries(self, url, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            # в captured_queries параметры уже подставлены в текст запроса
+            plan = explain(sql, ())
+            self.assertEqual(bad_plan_steps(plan), [], f'{sql}\n{plan}')
+        return response
+
+    def test_home_page(self):
+        self.assertIndexedQueries(reverse('home'))
+
+    def test_feed_first_page(self):
+        self.assertIndexedQueries(reverse('new'))
+
+    def test_feed_deep_page(self):
+        response = self.client.get(reverse('new'))
+        for _ in range(5):
+            cursor = response.context['page_obj'].next_cursor
+            response = self.assertIndexedQueries(f"{reverse('new')}?cursor={cursor}")
+        previous = response.context['page_obj'].previous_cursor
+        self.assertIndexedQueries(f"{reverse('new')}?cursor={previous}")
+
+    def test_detail_page_with_view_recording(self):
+        new = New.objects.active().first()
+        self.assertIndexedQueries(reverse('news_detail', args=[new.pk]), REMOTE_ADDR='192.168.1.1')
+        self.assertTrue(ViewCount.objects.filter(new=new, ip_address='192.168.1.1').exists())
+
+    def test_trending_page(self):
+        self.assertIndexedQueries(reverse('news_trending'))
+
+    def test_feed_since(self):
+        since = self.news[100].date_of_create.isoformat()
+        self.assertIndexedQueries(reverse('news_feed_atom'), data={'since': since})
+
+    def test_top_page(self):
+        self.assertIndexedQueries(reverse('news_top'))
+
+    def test_trending_score_follows_views(self):
+        new = New.objects.active().order_by('id').last()
+        for n in range(3):
+            self.client.get(reverse('news_detail', args=[new.pk]), REMOTE_ADDR=f'192.168.2.{n}')
+        response = self.client.get(reverse('news_trending'))
+        self.assertEqual(response.context['news_list'][0], new)
+
+    def test_stale_news_leave_trending(self):
+        fresh, stale = New.objects.active().order_by('id')[:2]
+        New.objects.filter(pk=fresh.pk).update(trending_score=min_trending_score(1))
+        # много просмотров месяц назад затухли до долей просмотра
+        New.objects.filter(pk=stale.pk).update(
+            trending_score=min_trending_score(1000, timezone.now() - timedelta(days=30)))
+        response = self.client.get(reverse('news_trending'))
+        self.assertEqual(list(response.context['news_list']), [fresh])
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        for query in queries.captured_queries:
+            self.assertEqual(bad_plan_steps(explain(query['sql'], ())), [], query['sql'])
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING,
+                   PERFORMANCE_PROFILING={'SAMPLE_RATE': 1, 'QUERY_BUDGET': 1, 'N_PLUS_ONE_THRESHOLD': 3})
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.news = seed_news(count=20, authors=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_header(self):
+        with self.assertLogs('pagenew.performance', 'WARNING') as logs:
+            response = self.client.get(reverse('new'))
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'render', 'view', 'total'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['over_budget'], ['queries'])
+        self.assertGreater(record['queries'], 1)
+
+    def test_repeated_queries_are_attributed_to_template_line(self):
+        template = engines['django'].from_string(
+            '{% for new in news %}\n{% for picture in new.picture_set.all %}{{ picture.pk }}{% endfor %}{% endfor %}'
+        )
+        with profile_request() as profile:
+            template.render({'news': New.objects.order_by('id')[:5]})
+        repeated = profile.repeated_queries(3)
+        self.assertEqual([(item['origin'], item['count']) for item in repeated], [('<unknown source>:2', 5)])
+
+
+@skipUnless(metrics_available(), 'prometheus_client не установлен')
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class MetricsTests(TestCase):
+    def test_metrics_by_url_name(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertRegex(body, r'news_http_requests_total\{method="GET",status="200",view="home"\} \d')
+        self.assertIn('news_db_queries_total{view="home"}', body)
+        self.assertIn('news_cache_requests_total{cache="page",result="hit"}', body)
+
+    def test_metrics_are_not_public(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class ExcerptTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email='writer@example.com', password='!', name='Автор',
+                                              date_of_birth=date(1990, 1, 1), login='writer')
+        cls.new = New.objects.create(title='Длинная новость', author=cls.author,
+                                     description='<p>Начало</p> ' + 'текст ' * 100 + 'КОНЕЦСТАТЬИ')
+
+    def test_excerpt_is_saved(self):
+        self.assertEqual(self.new.word_count, 102)
+        self.assertTrue(self.new.excerpt.startswith('Начало текст'))
+        self.assertTrue(self.new.excerpt.endswith('…'))
+        self.assertTrue(self.new.has_more_text)
+        self.new.description = 'Короткий текст'
+        self.new.save(update_fields=['description'])
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.excerpt, self.new.word_count), ('Короткий текст', 2))
+
+    def test_cards_do_not_load_full_text(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('new'))
+        self.assertNotIn('КОНЕЦСТАТЬИ', response.content.decode())
+        self.assertIn(reverse('news_text', args=[self.new.pk]), response.content.decode())
+        self.assertFalse(any('"description"' in query['sql'] for query in queries.captured_queries))
+
+    def test_full_text_endpoint(self):
+        response = self.client.get(reverse('news_text', args=[self.new.pk]))
+        self.assertEqual(response.json()['description'], self.new.description)
+        not_modified = self.client.get(reverse('news_text', args=[self.new.pk]),
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_backfill_command(self):
+        New.objects.filter(pk=self.new.pk).update(excerpt='', word_count=0)
+        call_command('backfill_excerpts', stdout=StringIO())
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.word_count, 102)
+
+
+@skipUnless(fts_available(), 'полнотекстовый индекс FTS5 есть только в SQLite')
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.in_title = New.objects.create(title='Ракета стартовала с Байконура', description='Запуск прошел штатно')
+        cls.in_description = New.objects.create(title='Новости космодрома', description='Ракета уйдет на орбиту завтра')
+        cls.unrelated = New.objects.create(title='Погода в Москве', description='Ожидается дождь')
+
+    def result_ids(self, query):
+        return [result['id'] for result in search_news(query, 10)]
+
+    def test_bm25_ranks_title_matches_first(self):
+        self.assertEqual(self.result_ids('ракета'), [self.in_title.pk, self.in_description.pk])
+
+    def test_cyrillic_prefix_is_case_insensitive(self):
+        self.assertEqual(build_match_query('РАКЕ старт'), '"РАКЕ"* "старт"*')
+        self.assertEqual(self.result_ids('РАКЕ старт'), [self.in_title.pk])
+        self.assertEqual(self.result_ids('москв'), [self.unrelated.pk])
+        self.assertEqual(self.result_ids('ракета дождь'), [])
+
+    def test_highlight_and_snippet_are_escaped(self):
+        new = New.objects.create(title='<script>alert(1)</script> Комета',
+                                 description='<img src=x onerror=alert(1)> комета & "хвост"')
+        [result] = search_news('комета', 10)
+        self.assertEqual(result['id'], new.pk)
+        self.assertEqual(result['title'], '&lt;script&gt;alert(1)&lt;/script&gt; <mark>Комета</mark>')
+        self.assertEqual(result['snippet'],
+                         '&lt;img src=x onerror=alert(1)&gt; <mark>комета</mark> &amp; &quot;хвост&quot;')
+        response = self.client.get(reverse('news_search'), {'q': 'комета'})
+        self.assertNotIn('<script>alert', response.content.decode())
+        self.assertNotIn('<img src=x', response.content.decode())
+
+    def test_fts_syntax_is_not_interpreted(self):
+        for query in ['"ракета', 'ракета AND', 'AND OR NOT', 'NEAR(ракета орбиту', 'ракета*', 'title:ракета',
+                      '-ракета', '^ракета', '()', '"', '*']:
+            with self.subTest(query=query):
+                search_news(query, 10)
+                self.assertEqual(self.client.get(reverse('news_search'), {'q': query}).status_code, 200)
+        self.assertEqual(self.result_ids('NEAR(ракета орбиту'), [])
+        self.assertEqual(self.result_ids('title:ракета'), [])
+
+    def test_archived_news_leave_index(self):
+        New.objects.filter(pk=self.in_title.pk).archive()
+        self.assertEqual(self.result_ids('ракета'), [self.in_description.pk])
+        self.in_description.is_archived = True
+        self.in_description.save()
+        self.assertEqual(self.result_ids('ракета'), [])
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class NewsFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.news = seed_news(count=50, authors=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_formats(self):
+        latest = New.objects.active().order_by('-date_of_create', '-id').first()
+        for name, content_type in (('news_feed_rss', 'application/rss+xml'),
+                                   ('news_feed_atom', 'application/atom+xml'),
+                                   ('news_feed_json', 'application/feed+json')):
+            with self.subTest(name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['Content-Type'].startswith(content_type))
+                body = response.content.decode()
+                self.assertIn(latest.title, body)
+                self.assertIn('rel="next"' if name != 'news_feed_json' else '"next_url"', body)
+
+    def test_enclosure_type_and_length(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        storage = Picture._meta.get_field('path').storage
+        new = New.objects.create(title='Новость с обложкой', description='Описание')
+        original = storage.save('static/img/cover.png', ContentFile(b'png' * 41))
+        copy = storage.save('static/img/derivatives/cover_320.jpg', ContentFile(b'jpeg' * 10))
+        Picture.objects.bulk_create([Picture(path=original, new=new)])
+        body = self.client.get(reverse('news_feed_rss')).content.decode()
+        self.assertIn(f'length="123" type="image/png" url="http://testserver{storage.url(original)}"', body)
+
+        Picture.objects.filter(new=new).update(derivatives={'variants': {'jpeg': {'320': copy}}})
+        with self.captureOnCommitCallbacks(execute=True):
+            new.save()
+        body = self.client.get(reverse('news_feed_rss')).content.decode()
+        self.assertIn(f'length="40" type="image/jpeg" url="http://testserver{storage.url(copy)}"', body)
+
+    def test_since_and_cursor(self):
+        active = list(New.objects.active().order_by('-date_of_create', '-id'))
+        since = active[3].date_of_create.isoformat()
+        items = self.client.get(reverse('news_feed_json'), {'since': since}).json()['items']
+        self.assertEqual([int(item['id']) for item in items], [new.pk for new in active[:3]])
+
+        seen = []
+        url = reverse('news_feed_json')
+        while url:
+            feed = self.client.get(url).json()
+            seen.extend(int(item['id']) for item in feed['items'])
+            url = feed.get('next_url')
+        self.assertEqual(seen, [new.pk for new in active])
+
+        self.assertEqual(self.client.get(reverse('news_feed_json'), {'since': 'вчера'}).status_code, 400)
+
+    def test_cached_until_content_changes(self):
+        url = reverse('news_feed_rss')
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            self.client.get(url)
+        # лента и ее валидаторы взяты из кеша
+        self.assertEqual(len(queries.captured_queries), 0)
+        new = New.objects.active().order_by('-date_of_create').first()
+        new.title = 'Обновленная новость'
+        with self.captureOnCommitCallbacks(execute=True):
+            new.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Обновленная новость', response.content.decode())
+
+    def test_since_is_normalized_in_cache_key(self):
+        active = list(New.objects.active().order_by('-date_of_create', '-id'))
+        url = reverse('news_feed_json')
+        # оба значения since лежат между одними и теми же соседними новостями
+        first = self.client.get(url, {'since': (active[3].date_of_create + timedelta(seconds=10)).isoformat()})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, {'since': (active[3].date_of_create + timedelta(seconds=20)).isoformat(),
+                                           'utm_source': 'bot'})
+        # только приведение since, лента и валидаторы взяты из кеша
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual([int(item['id']) for item in first.json()['items']], [new.pk for new in active[:3]])
+
+    def test_unknown_params_share_page_cache(self):
+        self.client.get(reverse('new'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('new'), {'utm_source': 'mail'})
+        self.assertEqual(response.status_code, 200)
+        # страница и ее валидаторы взяты из кеша
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_content_version_changes_after_commit(self):
+        version = get_content_version()
+        new = New.objects.active().first()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                new.save()
+                self.assertEqual(get_content_version(), version)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(get_content_version(), version)
+
+    def test_archive_changes_content_version_after_commit(self):
+        version = get_content_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                archived = New.objects.filter(pk=self.news[1].pk).archive()
+                self.assertEqual(get_content_version(), version)
+        self.assertEqual(archived, 1)
+        self.assertNotEqual(get_content_version(), version)
+        self.assertTrue(Picture.objects.filter(new=self.news[1]).exists())
+        self.assertFalse(Picture.objects.active().filter(new=self.news[1]).exists())
+
+
+# Бюджеты публичных страниц для холодного кеша страниц: не больше queries SQL-запросов
+# и ms миллисекунд. Число запросов не должно зависеть от количества карточек на странице,
+# поэтому рост бюджета при добавлении поля в карточку - признак N+1. Бюджеты времени
+# с запасом на медленные машины CI и ловят только грубые регрессии. Страница новости
+# включает запись просмотра (в тестах просмотры пишутся сразу).
+PAGE_BUDGETS = {
+    'home': {'queries': 5, 'ms': 500},
+    'new': {'queries': 5, 'ms': 500},
+    'news_trending': {'queries': 3, 'ms': 500},
+    'news_top': {'queries': 3, 'ms': 500},
+    'news_search': {'queries': 2, 'ms': 500, 'query': '?q=новость'},
+    'news_detail': {'queries': 10, 'ms': 500},
+    'news_text': {'queries': 2, 'ms': 500},
+    'news_feed_rss': {'queries': 3, 'ms': 500},
+    'news_feed_atom': {'queries': 3, 'ms': 500},
+    'news_feed_json': {'queries': 3, 'ms': 500},
+    'metrics': {'queries': 0, 'ms': 500},
+    'logout': {'queries': 3, 'ms': 500, 'method': 'post'},
+}
+
+
+def format_queries(profile):
+    """ SQL-запросы профиля, сгруппированные по месту вызова, для сообщения об ошибке. """
+    groups = {}
+    for sql, origin, duration in profile.queries:
+        groups.setdefault(origin, []).append((sql, duration))
+    lines = []
+    for origin, queries in sorted(groups.items(), key=lambda item: -len(item[1])):
+        lines.append(f'{origin}: {len(queries)} запрос(ов), {sum(d for _, d in queries) * 1000:.1f} мс')
+        lines.extend(f'    {sql}' for sql, _ in queries)
+    return '\n'.join(lines)
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class PageBudgetTests(TestCase):
+    """
+    Каждая страница pagenew.urls отрисовывается на заполненной базе при пустом кеше
+    для гостя и для администратора и укладывается в свой бюджет из PAGE_BUDGETS.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.news = seed_news()
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', password='!', name='Админ', date_of_birth=date(1990, 1, 1),
+            login='admin', role=get_or_create_role('Администратор'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        clear_role_cache()
+        install_query_profiler_on_all()
+
+    def get_url(self, name):
+        args = [New.objects.active().order_by('id').first().pk] if name in ('news_detail', 'news_text') else []
+        return reverse(name, args=args) + PAGE_BUDGETS[name].get('query', '')
+
+    def assertWithinBudget(self, name):
+        budget = PAGE_BUDGETS[name]
+        url = self.get_url(name)
+        with profile_request() as profile:
+            response = getattr(self.client, budget.get('method', 'get'))(url)
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        self.assertLess(response.status_code, 500, url)
+        details = f'{url}: {len(profile.queries)} запросов, {total_ms:.0f} мс\n{format_queries(profile)}'
+        self.assertLessEqual(len(profile.queries), budget['queries'], details)
+        self.assertLessEqual(total_ms, budget['ms'], details)
+        threshold = get_profiling_options()['N_PLUS_ONE_THRESHOLD']
+        self.assertEqual(profile.repeated_queries(threshold), [], details)
+
+    def test_every_page_has_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names - set(PAGE_BUDGETS), set())
+
+    def test_anonymous_pages(self):
+        for name in PAGE_BUDGETS:
+            with self.subTest(name):
+                cache.clear()
+                self.assertWithinBudget(name)
+
+    def test_warm_cache_hits_make_no_queries(self):
+        # без буферизации просмотр страницы новости писался бы в базу в том же запросе
+        self.enterContext(mock.patch.object(ViewRecorder, 'record'))
+        for name in ('home', 'new', 'news_trending', 'news_top', 'news_detail',
+                     'news_feed_rss', 'news_feed_atom', 'news_feed_json'):
+            with self.subTest(name):
+                cache.clear()
+                url = self.get_url(name)
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_admin_pages(self):
+        for name in PAGE_BUDGETS:
+            with self.subTest(name):
+                cache.clear()
+                self.client.force_login(self.admin)
+                self.assertWithinBudget(name)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.storage = ContentAddressedStorage(location=self.enterContext(tempfile.TemporaryDirectory()))
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('static/img/a.jpg', ContentFile(b'picture'))
+        second = self.storage.save('static/img/b.JPG', ContentFile(b'picture'))
+        self.assertEqual(first, second)
+        self.assertTrue(self.storage.is_hashed_name(first))
+        self.assertNotEqual(self.storage.save('static/img/c.jpg', ContentFile(b'other')), first)
+
+    def test_concurrent_save_of_same_content(self):
+        name = self.storage.save('static/img/a.jpg', ContentFile(b'picture'))
+        # файл появился после проверки exists(): сохранение не должно подбирать новое имя бесконечно
+        with mock.patch.object(ContentAddressedStorage, 'exists', return_value=False):
+            self.assertEqual(self.storage.save('static/img/a.jpg', ContentFile(b'picture')), name)
+        self.assertEqual(self.storage.open(name).read(), b'picture')
+
+
+class GcPictureBlobsTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.storage = Picture._meta.get_field('path').storage
+        self.new = New.objects.create(title='Новость', description='Описание')
+
+    def save_blob(self, content, age_hours=0):
+        name = self.storage.save('static/img/blob.jpg', ContentFile(content))
+        stem = os.path.splitext(os.path.basename(name))[0]
+        derivative = f'static/img/derivatives/{stem}_320.webp'
+        os.makedirs(os.path.dirname(self.storage.path(derivative)), exist_ok=True)
+        with open(self.storage.path(derivative), 'wb') as file:
+            file.write(b'copy')
+        modified = time.time() - age_hours * 3600
+        for path in (name, derivative):
+            os.utime(self.storage.path(path), (modified, modified))
+        return name, derivative
+
+    def test_removes_only_old_unreferenced_blobs(self):
+        used, used_copy = self.save_blob(b'used', age_hours=48)
+        # bulk_create: без постановки генерации производных в пул процессов
+        Picture.objects.bulk_create([Picture(path=used, new=self.new)])
+        unused, unused_copy = self.save_blob(b'unused', age_hours=48)
+        fresh, fresh_copy = self.save_blob(b'fresh')
+
+        call_command('gc_picture_blobs', stdout=StringIO())
+
+        for name in (used, used_copy, fresh, fresh_copy):
+            self.assertTrue(self.storage.exists(name), name)
+        for name in (unused, unused_copy):
+            self.assertFalse(self.storage.exists(name), name)
+
+
+@skipUnless(pillow_available(), 'Pillow не установлен')
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class PictureDerivativesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.storage = Picture._meta.get_field('path').storage
+        self.new = New.objects.create(title='Новость', description='Описание')
+
+    def save_image(self, size=(800, 400), mode='RGBA'):
+        from PIL import Image
+
+        content = BytesIO()
+        Image.new(mode, size, (200, 100, 50, 128) if mode == 'RGBA' else (200, 100, 50)).save(content, 'PNG')
+        name = self.storage.save('static/img/picture.png', ContentFile(content.getvalue()))
+        # bulk_create: без постановки генерации производных в пул процессов
+        return Picture.objects.bulk_create([Picture(path=name, new=self.new)])[0]
+
+    def test_widths_and_formats(self):
+        from PIL import Image, features
+
+        picture = self.save_image()
+        source, output_dir, base_name, *_ = build_job(picture)
+        metadata = make_derivatives(source, output_dir, base_name, [320, 640, 1024], ['avif', 'webp', 'jpeg', 'gif'], 80)
+        self.assertEqual((metadata['width'], metadata['height']), (800, 400))
+        # копии крупнее оригинала не создаются, вместо них - копия в ширину оригинала
+        expected = {fmt for fmt in ('avif', 'webp') if features.check(fmt)} | {'jpeg'}
+        self.assertEqual(set(metadata['variants']), expected)
+        for fmt, files in metadata['variants'].items():
+            self.assertEqual(set(files), {'320', '640', '800'})
+        with Image.open(os.path.join(output_dir, metadata['variants']['jpeg']['320'])) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (320, 160)))
+
+    def test_saved_derivatives_are_rendered(self):
+        picture = self.save_image()
+        job = build_job(picture)
+        metadata = make_derivatives(*job[:3], [320, 640], ['avif', 'webp', 'jpeg'], 80)
+        save_derivatives(picture.pk, picture.path.name, metadata)
+        picture.refresh_from_db()
+        self.assertIn('_640.jpg 640w', picture.jpeg_srcset)
+        self.assertTrue(picture.display_url.endswith('_640.jpg'))
+
+        body = self.client.get(reverse('news_detail', args=[self.new.pk])).content.decode()
+        for fmt in metadata['variants']:
+            if fmt != 'jpeg':
+                self.assertIn(f'<source type="image/{fmt}" srcset="{picture.get_srcset(fmt)}" sizes=', body)
+        self.assertIn(f'srcset="{picture.jpeg_srcset}" sizes=', body)
+
+    def test_first_slide_is_not_lazy(self):
+        self.save_image()
+        self.save_image(mode='RGB')
+        body = self.client.get(reverse('new')).content.decode()
+        images = [line for line in body.splitlines() if '<img ' in line and 'd-block w-100' in line]
+        self.assertEqual(len(images), 2)
+        self.assertNotIn('loading="lazy"', images[0])
+        self.assertIn('loading="lazy"', images[1])
+
+
+class ViewRecorderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.new = New.objects.create(title='Новость', description='Описание')
+
+    def make_recorder(self, **options):
+        options = {'batch_size': 10, 'flush_interval': 0, 'max_pending': 100, **options}
+        return ViewRecorder(LocalViewQueue(), **options)
+
+    def test_failed_flush_is_requeued(self):
+        recorder = self.make_recorder()
+        with mock.patch.object(recorder, 'write_batch', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('pagenew.services.view_recorder', 'ERROR'):
+            recorder.record(self.new.pk, '10.0.0.1')
+        self.assertEqual(len(recorder.queue), 1)
+        self.assertTrue(recorder.is_backing_off())
+        # во время паузы запросы не пытаются писать сами
+        recorder.record(self.new.pk, '10.0.0.2')
+        self.assertEqual(len(recorder.queue), 2)
+
+        recorder._retry_at = 0
+        self.assertEqual(recorder.flush(), 2)
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.unique_views, 2)
+
+    def test_worker_survives_failed_flush(self):
+        recorder = self.make_recorder(flush_interval=0.01)
+        written = threading.Event()
+        errors = [OperationalError('database is locked')]
+
+        def write_batch(batch):
+            if errors:
+                raise errors.pop()
+            written.set()
+
+        with mock.patch.object(recorder, 'write_batch', side_effect=write_batch), \
+                mock.patch('pagenew.services.view_recorder.MAX_RETRY_DELAY', 0.05), \
+                self.assertLogs('pagenew.services.view_recorder', 'ERROR'):
+            recorder.record(self.new.pk, '10.0.0.1')
+            self.assertTrue(written.wait(5))
+        self.assertTrue(recorder._worker.is_alive())
+        self.assertEqual(len(recorder.queue), 0)
+
+    def test_daily_aggregate_counts_every_view(self):
+        for unique_mode in ('exact', 'hll'):
+            with self.subTest(unique_mode):
+                new = New.objects.create(title=f'Новость {unique_mode}', description='Описание')
+                recorder = self.make_recorder(unique_mode=unique_mode)
+                for ip_address in ('10.0.0.1', '10.0.0.1', '10.0.0.2'):
+                    recorder.record(new.pk, ip_address)
+                aggregate = ViewDailyAggregate.objects.get(new=new, day=timezone.localdate())
+                self.assertEqual((aggregate.views, aggregate.unique_ips), (3, 2))
+
+
+    def test_only_inserted_rows_are_unique(self):
+        # пару (статья, IP) уже записал другой процесс
+        ViewCount.objects.create(new=self.new, ip_address='10.0.0.1')
+        self.make_recorder().write_batch([(self.new.pk, '10.0.0.1'), (self.new.pk, '10.0.0.2'),
+                                          (self.new.pk, '10.0.0.2')])
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.total_views, self.new.unique_views), (3, 1))
+        self.assertEqual(ViewCount.objects.filter(new=self.new).count(), 2)
+
+    def test_hll_batches_merge_into_stored_sketches(self):
+        recorder = self.make_recorder(unique_mode='hll', batch_size=2)
+        for ip_address in ('10.0.0.1', '10.0.0.2', '10.0.0.2', '10.0.0.3'):
+            recorder.record(self.new.pk, ip_address)
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.total_views, self.new.unique_views), (4, 3))
+        self.assertEqual(self.new.get_unique_viewers(timezone.localdate(), timezone.localdate()), 3)
+
+
+
+class ConcurrentViewWritesTests(TransactionTestCase):
+    """ Несколько процессов-воркеров пишут просмотры одних и тех же посетителей одновременно. """
+    def test_each_visitor_is_counted_once(self):
+        new = New.objects.create(title='Новость', description='Описание')
+        ips = [f'10.0.0.{n}' for n in range(40)]
+        start = threading.Barrier(4)
+        errors = []
+
+        def worker():
+            recorder = ViewRecorder(LocalViewQueue(), batch_size=10, flush_interval=60, max_pending=1000)
+            for ip_address in ips:
+                recorder.queue.put((new.pk, ip_address))
+            try:
+                start.wait()
+                recorder.flush()
+                self.assertEqual(len(recorder.queue), 0)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        with self.assertNoLogs('pagenew.services.view_recorder', 'ERROR'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        new.refresh_from_db()
+        self.assertEqual((new.total_views, new.unique_views), (160, 40))
+        self.assertEqual(ViewCount.objects.filter(new=new).count(), 40)
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING)
+class AsyncViewsTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.news = seed_news(count=20, authors=2)
+
+    async def test_pages_match_sync_views(self):
+        cursor = (await sync_to_async(self.client.get)(reverse('new'))).context['page_obj'].next_cursor
+        for url in (reverse('home'), reverse('new'), f"{reverse('new')}?cursor={cursor}"):
+            with self.subTest(url):
+                await cache.aclear()
+                response = await self.async_client.get(url)
+                await cache.aclear()
+                expected = await sync_to_async(self.client.get)(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+    async def test_sync_cache_is_not_used_on_event_loop(self):
+        calls_on_loop = []
+
+        def watch(method):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass
+                else:
+                    calls_on_loop.append(method.__name__)
+                return method(*args, **kwargs)
+            return wrapper
+
+        new = await New.objects.active().order_by('id').afirst()
+        with mock.patch.object(ViewRecorder, 'record'):
+            for name in ('get', 'set', 'add', 'get_many', 'set_many'):
+                self.enterContext(mock.patch.object(LocMemCache, name, watch(getattr(LocMemCache, name))))
+            for url in (reverse('home'), reverse('new'), reverse('news_detail', args=[new.pk])):
+                # без кеша (фрагменты {% cache %}) и из кеша страниц
+                for _ in range(2):
+                    self.assertEqual((await self.async_client.get(url)).status_code, 200)
+        self.assertEqual(calls_on_loop, [])
+
+    async def test_detail_view_is_recorded(self):
+        new = await New.objects.active().order_by('id').afirst()
+        url = reverse('news_detail', args=[new.pk])
+        closed = threading.Event()
+        recorded_in = set()
+        record, close_all = ViewRecorder.record, connections.close_all
+
+        def record_and_remember(recorder, *args):
+            record(recorder, *args)
+            recorded_in.add(threading.get_ident())
+
+        def close_all_and_signal():
+            close_all()
+            # close_all зовут и фоновые потоки записи, оставшиеся от других тестов
+            if threading.get_ident() in recorded_in:
+                closed.set()
+
+        response = await self.async_client.get(url)
+        self.assertContains(response, new.title)
+        # без кеша просмотр записывает сама страница, из кеша - фоновая задача
+        with mock.patch.object(connections, 'close_all', close_all_and_signal), \
+                mock.patch.object(ViewRecorder, 'record', record_and_remember):
+            await self.async_client.get(url, headers={'X-Forwarded-For': '10.1.0.1'})
+            self.assertTrue(await asyncio.to_thread(closed.wait, 5))
+        # просмотры, созданные seed_news, идут с адресов 10.0.*.*
+        views = ViewCount.objects.filter(new=new).exclude(ip_address__startswith='10.0.')
+        ips = [ip async for ip in views.values_list('ip_address', flat=True)]
+        self.assertEqual(sorted(ips), ['10.1.0.1', '127.0.0.1'])
+
+
+class SqliteWriteLockTests(TransactionTestCase):
+    """
+    Транзакции основной базы начинаются с блокировки записи: потоки одного процесса
+    идут по очереди, а чтение с последующей записью не ломается от записи другого процесса.
+    """
+    def run_threads(self, *targets):
+        errors = []
+
+        def worker(target):
+            try:
+                target()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=[target]) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_read_modify_write(self):
+        new = New.objects.create(title='Новость', description='Описание')
+
+        def increment():
+            for _ in range(10):
+                with transaction.atomic():
+                    views = New.objects.values_list('total_views', flat=True).get(pk=new.pk)
+                    time.sleep(0.001)
+                    New.objects.filter(pk=new.pk).update(total_views=views + 1)
+
+        self.run_threads(*[increment] * 4)
+        new.refresh_from_db()
+        self.assertEqual(new.total_views, 40)
+
+    def test_read_then_write_while_other_process_writes(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, 'shared.sqlite3')
+        stop = os.path.join(directory, 'stop')
+        connections.settings['shared'] = {**connections['default'].settings_dict, 'NAME': path}
+        self.addCleanup(connections.settings.pop, 'shared')
+        self.addCleanup(connections.__delitem__, 'shared')
+        self.addCleanup(lambda: connections['shared'].close())
+        shared = connections['shared']
+        with shared.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+            cursor.execute('INSERT INTO counter VALUES (1, 0), (2, 0)')
+
+        # другой процесс, как сброс просмотров, пишет в автокоммите без перерыва
+        writer = subprocess.Popen([sys.executable, '-c', SHARED_DB_WRITER, path, stop])
+        self.addCleanup(writer.kill)
+        deadline = time.monotonic() + 10
+        with shared.cursor() as cursor:
+            while cursor.execute('SELECT value FROM counter WHERE id = 2').fetchone()[0] == 0:
+                self.assertIsNone(writer.poll())
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+        for _ in range(50):
+            # как сохранение в админке: сначала чтение, затем запись
+            with transaction.atomic(using='shared'), shared.cursor() as cursor:
+                value = cursor.execute('SELECT value FROM counter WHERE id = 1').fetchone()[0]
+                time.sleep(0.002)
+                cursor.execute('UPDATE counter SET value = %s WHERE id = 1', [value + 1])
+        open(stop, 'w').close()
+        self.assertEqual(writer.wait(10), 0)
+        with shared.cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT value FROM counter WHERE id = 1').fetchone()[0], 50)
+
+
+# пишет в базу argv[1] отдельными транзакциями, пока не появится файл argv[2]
+SHARED_DB_WRITER = """
+import os, sqlite3, sys
+db = sqlite3.connect(sys.argv[1], timeout=5, isolation_level=None)
+while not os.path.exists(sys.argv[2]):
+    db.execute('UPDATE counter SET value = value + 1 WHERE id = 2')
+"""
+
+
+def make_sketch(values, precision=12):
+    sketch = HyperLogLog(precision)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+class HyperLogLogTests(TestCase):
+    def test_error_rate(self):
+        for error_rate in (0.02, 0.05):
+            precision = HyperLogLog.for_error_rate(error_rate).precision
+            for count in (100, 1000, 50000):
+                with self.subTest(error_rate=error_rate, count=count):
+                    ips = (f'10.{n // 65536}.{n // 256 % 256}.{n % 256}' for n in range(count))
+                    sketch = make_sketch(ips, precision=precision)
+                    self.assertLess(abs(sketch.count() - count) / count, 3 * error_rate)
+
+    def test_merge_equals_sketch_of_union(self):
+        first = make_sketch(range(0, 10000))
+        second = make_sketch(range(5000, 15000))
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+        self.assertEqual(merged.registers, make_sketch(range(15000)).registers)
+        self.assertEqual(merged.merge(second).registers, make_sketch(range(15000)).registers)
+
+    def test_merge_different_precision(self):
+        # после изменения HLL_ERROR_RATE счетчики старых и новых дней имеют разную точность
+        first = make_sketch(range(0, 10000), precision=12)
+        second = make_sketch(range(5000, 15000), precision=10)
+        self.assertEqual(first.fold(10).registers, make_sketch(range(10000), precision=10).registers)
+        merged = first.merge(second)
+        self.assertEqual(merged.precision, 10)
+        self.assertEqual(merged.registers, make_sketch(range(15000), precision=10).registers)
+
+    def test_unique_viewers_across_precisions(self):
+        new = New.objects.create(title='Новость', description='Описание')
+        today = timezone.localdate()
+        ViewSketch.objects.create(new=new, day=today - timedelta(days=1),
+                                  sketch=make_sketch(range(0, 600), precision=12).to_bytes())
+        ViewSketch.objects.create(new=new, day=today, sketch=make_sketch(range(400, 1000), precision=10).to_bytes())
+        self.assertLess(abs(new.get_unique_viewers(today - timedelta(days=1), today) - 1000), 100)
+
+
+class RollupViewsTests(TestCase):
+    def setUp(self):
+        self.viewed_on = timezone.now() - timedelta(days=100)
+        self.open_new = New.objects.create(title='Открытая новость', description='Описание')
+        self.archived_new = New.objects.create(title='Архивная новость', description='Описание')
+        ViewCount.objects.bulk_create([
+            ViewCount(new=new, ip_address=ip_address)
+            for new in (self.open_new, self.archived_new) for ip_address in ('10.0.0.1', '10.0.0.2')
+        ])
+        ViewCount.objects.update(viewed_on=self.viewed_on)
+        New.objects.update(unique_views=2, total_views=2)
+        New.objects.filter(pk=self.archived_new.pk).update(is_archived=True, updated_at=self.viewed_on)
+
+    def test_rollup_restores_days_before_live_aggregates(self):
+        call_command('rollup_views', retention_days=None, stdout=StringIO())
+        call_command('rollup_views', retention_days=None, stdout=StringIO())
+        day = timezone.localdate(self.viewed_on)
+        self.assertCountEqual(
+            ViewDailyAggregate.objects.values_list('new_id', 'day', 'views', 'unique_ips'),
+            [(self.open_new.pk, day, None, 2), (self.archived_new.pk, day, None, 2)],
+        )
+
+    def test_returning_visitors_are_not_counted_again(self):
+        call_command('rollup_views', retention_days=90, stdout=StringIO())
+        self.assertFalse(ViewCount.objects.filter(new=self.archived_new).exists())
+        self.assertEqual(ViewCount.objects.filter(new=self.open_new).count(), 2)
+
+        recorder = ViewRecorder(LocalViewQueue(), batch_size=10, flush_interval=0, max_pending=100)
+        recorder.record(self.open_new.pk, '10.0.0.1')
+        self.open_new.refresh_from_db()
+        self.assertEqual((self.open_new.total_views, self.open_new.unique_views), (3, 2))
+        today = ViewDailyAggregate.objects.get(new=self.open_new, day=timezone.localdate())
+        self.assertEqual((today.views, today.unique_ips), (1, 0))
+
+        call_command('recount_views', stdout=StringIO())
+        self.assertEqual(
+            dict(New.objects.values_list('id', 'unique_views')),
+            {self.open_new.pk: 2, self.archived_new.pk: 2},
+        )
+
+    def test_recount_updates_each_chunk_in_one_statement(self):
+        ViewDailyAggregate.objects.create(new=self.archived_new, day=timezone.localdate(self.viewed_on),
+                                          unique_ips=3, compacted=True)
+        New.objects.update(unique_views=0, total_views=1)
+        sketch = make_sketch([f'10.0.2.{n}' for n in range(5)])
+        New.objects.filter(pk=self.open_new.pk).update(views_sketch=sketch.to_bytes())
+        with CaptureQueriesContext(connection) as queries:
+            call_command('recount_views', stdout=StringIO())
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(
+            list(New.objects.order_by('id').values_list('unique_views', 'total_views')),
+            [(2, 2), (5, 5)],
+        )
+
+        with override_settings(VIEW_RECORDING={**TEST_VIEW_RECORDING, 'UNIQUE_MODE': 'hll'}):
+            call_command('recount_views', stdout=StringIO())
+        self.open_new.refresh_from_db()
+        self.assertEqual(self.open_new.unique_views, sketch.count())
+
+    def test_compact_commits_each_batch(self):
+        ViewCount.objects.bulk_create([ViewCount(new=self.archived_new, ip_address=f'10.0.1.{n}') for n in range(3)])
+        ViewDailyAggregate.objects.create(new=self.archived_new, day=timezone.localdate(self.viewed_on), unique_ips=5)
+        delete = QuerySet.delete
+        calls = []
+
+        def fail_on_second_batch(queryset):
+            calls.append(queryset.model)
+            if len(calls) == 2:
+                raise OperationalError('database is locked')
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', fail_on_second_batch), self.assertRaises(OperationalError):
+            call_command('rollup_views', retention_days=90, batch_size=2, stdout=StringIO())
+        # первая порция зафиксирована, сводка еще не помечена
+        self.assertEqual(ViewCount.objects.filter(new=self.archived_new).count(), 3)
+        self.assertFalse(ViewDailyAggregate.objects.get(new=self.archived_new).compacted)
+
+        call_command('rollup_views', retention_days=90, batch_size=2, stdout=StringIO())
+        self.assertFalse(ViewCount.objects.filter(new=self.archived_new).exists())
+        self.assertTrue(ViewDailyAggregate.objects.get(new=self.archived_new).compacted)
+
+
+@override_settings(CACHES=TEST_CACHES, VIEW_RECORDING=TEST_VIEW_RECORDING, PERFORMANCE_PROFILING=TEST_PROFILING,
+                   DATABASE_REPLICAS=['replica'],
+                   REPLICA_ROUTING={'STICKY_SECONDS': 30, 'HEALTH_CHECK_INTERVAL': 60, 'MAX_LAG': None})
+class ReplicaRoutingTests(TransactionTestCase):
+    """ Реплика - второй файл SQLite, который заполняет команда sync_replica. """
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        default = connections['default'].settings_dict
+        connections.settings['replica'] = {
+            **default,
+            'NAME': os.path.join(directory.name, 'replica.sqlite3'),
+            'OPTIONS': {**default['OPTIONS'], 'transaction_mode': 'DEFERRED', 'write_lock': False},
+        }
+        self.addCleanup(connections.settings.pop, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(lambda: connections['replica'].close())
+        self.synced = New.objects.create(title='Синхронизированная новость', description='Описание')
+        call_command('sync_replica', stdout=StringIO())
+        self.unsynced = New.objects.create(title='Новость после синхронизации', description='Описание')
+
+    def feed_titles(self):
+        return [item['title'] for item in self.client.get(reverse('news_feed_json')).json()['items']]
+
+    def test_reads_are_routed_to_replica(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(New), 'default')
+        self.assertEqual(router.db_for_write(New), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(New), 'replica')
+            self.assertEqual(router.db_for_write(New), 'default')
+            self.assertEqual(New.objects.count(), 1)
+            with transaction.atomic():
+                # внутри транзакции читается основная база
+                self.assertEqual(New.objects.count(), 2)
+        self.assertEqual(New.objects.count(), 2)
+        self.assertFalse(connections['replica'].in_atomic_block or connections['replica'].holds_write_lock)
+
+    def test_sticky_primary_after_write(self):
+        self.assertEqual(self.feed_titles(), [self.synced.title])
+
+        response = self.client.post(reverse('logout'))
+        self.assertIn('db_primary', response.cookies)
+        self.assertEqual(self.feed_titles(), [self.unsynced.title, self.synced.title])
+
+        del self.client.cookies['db_primary']
+        call_command('sync_replica', stdout=StringIO())
+        self.assertEqual(self.feed_titles(), [self.unsynced.title, self.synced.title])
+
+
+class RoleCacheTests(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.role = get_or_create_role('Редактор')
+
+    def test_instances_are_not_shared(self):
+        role = get_role_by_id(self.role.pk)
+        role.title = 'Изменено в другом запросе'
+        for cached in (get_role_by_id(self.role.pk), get_or_create_role('Редактор')):
+            self.assertIsNot(cached, role)
+            self.assertEqual(cached.title, 'Редактор')
+            self.assertEqual(cached.pk, self.role.pk)
+            self.assertFalse(cached._state.adding)
+
+    def test_cleared_on_setting_changed(self):
+        get_role_by_id(self.role.pk)
+        with self.assertNumQueries(0):
+            get_role_by_id(self.role.pk)
+        # update() не вызывает сигналов модели, как изменение роли из другого процесса
+        Role.objects.filter(pk=self.role.pk).update(title='Автор')
+        self.assertEqual(get_role_by_id(self.role.pk).title, 'Редактор')
+        with override_settings(ROLE_TEST=True):
+            self.assertEqual(get_role_by_id(self.role.pk).title, 'Автор')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        get_or_create_role('Редактор')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'users.ndjson')
+
+    def import_users(self, rows, *args):
+        with open(self.path, 'w', encoding='utf-8') as target:
+            target.writelines(f'{row}\n' for row in rows)
+        call_command('import_users', self.path, '--workers=1', *args, stdout=StringIO())
+        with open(f'{self.path}.errors.csv', encoding='utf-8', newline='') as report:
+            return {int(row['line']): (row['field'], row['message']) for row in csv.DictReader(report)}
+
+    def user_row(self, login, **fields):
+        return json.dumps({'email': f'{login}@example.com', 'password': 'secret', 'name': 'Игрок',
+                           'date_of_birth': '1990-01-01', 'login': login, **fields}, ensure_ascii=False)
+
+    def test_rows_must_be_objects_with_existing_roles(self):
+        errors = self.import_users([
+            self.user_row('player1'),
+            '["player2@example.com", "secret"]',
+            '"player3"',
+            self.user_row('player4', role='Редактор'),
+            self.user_row('player5', role='Модератор'),
+            self.user_row('player6', email=6),
+        ])
+        self.assertEqual(set(errors), {2, 3, 5, 6})
+        self.assertEqual(errors[2], ('', 'Строка должна быть JSON-объектом'))
+        self.assertEqual(errors[5][0], 'role')
+        self.assertEqual(errors[6][0], 'email')
+        self.assertEqual(dict(User.objects.values_list('login', 'role__title')),
+                         {'player1': 'Клиент', 'player4': 'Редактор'})
+        self.assertFalse(Role.objects.filter(title='Модератор').exists())
+        self.assertTrue(User.objects.get(login='player1').check_password('secret'))
+
+    def test_create_roles(self):
+        errors = self.import_users([self.user_row('player1', role='Модератор')], '--create-roles')
+        self.assertEqual(errors, {})
+        self.assertEqual(User.objects.get(login='player1').role.title, 'Модератор')
@@ -5,7 +5,15 @@ from django.contrib.auth.views import LogoutView
 urlpatterns = [
     path('', views.HomePageView.as_view(), name='home'),
     path('news/', views.NewPageView.as_view(), name='new'),
+    path('news/trending/', views.TrendingNewsView.as_view(), name='news_trending'),
+    path('news/top/', views.TopNewsView.as_view(), name='news_top'),
+    path('news/search/', views.NewSearchView.as_view(), name='news_search'),
+    path('news/feed/rss/', views.NewsFeedView.as_view(feed_format='rss'), name='news_feed_rss'),
+    path('news/feed/atom/', views.NewsFeedView.as_view(feed_format='atom'), name='news_feed_atom'),
+    path('news/feed/json/', views.NewsFeedView.as_view(feed_format='json'), name='news_feed_json'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('news/<int:pk>/', views.NewDetailView.as_view(), name='news_detail'),
+    path('news/<int:pk>/text/', views.NewTextView.as_view(), name='news_text'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,17 @@
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# асинхронные варианты страниц, остальные маршруты совпадают с pagenew.urls
+ASYNC_VIEWS = {
+    'home': async_views.AsyncHomePageView.as_view(),
+    'new': async_views.AsyncNewPageView.as_view(),
+    'news_detail': async_views.AsyncNewDetailView.as_view(),
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
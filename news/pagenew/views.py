@@ -1,27 +1,229 @@
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, HttpResponseBadRequest, Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
 from django.views.generic import TemplateView, DetailView, ListView
 from .models import New
-from .mixins import ViewCountMixin
+from .mixins import CachedPageMixin, ConditionalPageMixin, ViewCountMixin, build_validators, set_validators
+from .services.feeds import build_feed, build_feed_query, get_feed_page, normalize_since, parse_since
+from .services.metrics import get_metrics, get_metrics_options, observe_cache
+from .services.page_cache import build_page_key, get_page_cache, get_page_version
+from .services.pagination import CursorPaginator
+from .services.popularity import min_trending_score
+from .services.search import search_news
+from .services.view_recorder import get_view_recording_options
 
-class HomePageView(ListView):
+class NewsListValidatorsMixin:
+    """
+    Валидаторы списков новостей: меняются при любом сохранении или архивации новости
+    и при изменении ее изображений.
+    """
+    def get_validators(self, request, *args, **kwargs):
+        last_modified = New.objects.last_change()
+        return f'{last_modified}', last_modified
+
+
+class HomePageView(NewsListValidatorsMixin, ConditionalPageMixin, CachedPageMixin, ListView):
     template_name = 'home.html'
     context_object_name = 'news_list'
 
     def get_queryset(self):
-        return New.objects.filter(is_archived=False).order_by('-date_of_create')[:4]
+        return New.objects.active().for_cards().order_by('-date_of_create', '-id')[:4]
 
 
-class NewPageView(ListView):
+class NewPageView(NewsListValidatorsMixin, ConditionalPageMixin, CachedPageMixin, ListView):
     template_name = 'newpage.html'
     context_object_name = 'news_list'
     paginate_by = 8
+    page_cache_params = ('cursor',)
 
     def get_queryset(self):
-        return New.objects.filter(is_archived=False)
+        return New.objects.active().for_cards()
+
+    def paginate_queryset(self, queryset, page_size):
+        """ Курсорная пагинация по (date_of_create, id) вместо OFFSET; с неверным курсором - первая страница. """
+        paginator = CursorPaginator(queryset, page_size, estimate_pages=True,
+                                    estimate_cache_key='news_feed_count')
+        page = paginator.page(paginator.valid_cursor(self.request.GET.get('cursor')))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class NewsRankingView(CachedPageMixin, ListView):
+    """
+    Рейтинг новостей по полю ranking_field. Оценки обновляются при записи
+    просмотров, а не при изменении новостей, поэтому страница живет в кеше недолго.
+    """
+    template_name = 'news_ranking.html'
+    context_object_name = 'news_list'
+    page_cache_timeout = 60
+    ranking_field = None
+    heading = None
+    limit = 20
+
+    def get_queryset(self):
+        queryset = self.filter_ranking(New.objects.active().for_cards())
+        return queryset.order_by(f'-{self.ranking_field}', '-id')[:self.limit]
+
+    def filter_ranking(self, queryset):
+        return queryset
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['heading'] = self.heading
+        return context
 
-class NewDetailView(ViewCountMixin, DetailView):
-    model = New
+
+class TrendingNewsView(NewsRankingView):
+    """
+    Новости с наибольшей затухающей оценкой. Новость пропадает отсюда, когда оценка
+    затухает ниже min_recent_views «свежих» просмотров: по умолчанию - ниже одного
+    просмотра, сделанного период полураспада назад.
+    """
+    ranking_field = 'trending_score'
+    heading = 'Популярное сейчас'
+    min_recent_views = 0.5
+
+    def filter_ranking(self, queryset):
+        half_life = get_view_recording_options()['TRENDING_HALF_LIFE_HOURS']
+        return queryset.filter(trending_score__gte=min_trending_score(self.min_recent_views, half_life_hours=half_life))
+
+
+class TopNewsView(NewsRankingView):
+    ranking_field = 'total_views'
+    heading = 'Самое читаемое'
+
+
+class NewDetailView(ConditionalPageMixin, CachedPageMixin, ViewCountMixin, DetailView):
+    queryset = New.objects.active().for_listing()
     template_name = 'new_detail.html'
-    context_object_name = 'new_instance'
\ No newline at end of file
+    context_object_name = 'new_instance'
+    # на странице выводится счетчик просмотров, поэтому она живет в кеше недолго
+    page_cache_timeout = 60
+
+    def get_validators(self, request, *args, **kwargs):
+        row = New.objects.active().filter(pk=kwargs['pk']).values_list('updated_at', 'unique_views').first()
+        if row is None:
+            return None
+        updated_at, unique_views = row
+        # счетчик просмотров выводится на странице, поэтому входит в ETag
+        return f'{updated_at}:{unique_views}', updated_at
+
+    def on_cache_hit(self, request, *args, **kwargs):
+        self.record_view(kwargs['pk'])
+
+    def on_not_modified(self, request, *args, **kwargs):
+        self.record_view(kwargs['pk'])
+
+
+class CachedFeedView(View):
+    """
+    Лента новостей в формате feed_format (rss, atom или json) для ботов и лаунчера.
+
+    Параметр since (ISO 8601 или unix-время) оставляет только новости новее этой даты,
+    cursor продолжает ленту со следующей страницы (ссылка next в самой ленте),
+    неверный cursor отбрасывается, и отдается первая страница.
+    Лента строится один раз на поколение контента и дальше отдается из кеша страниц;
+    since для ключа приводится к дате новости (normalize_since), остальные параметры
+    запроса в ключ не входят. Вместе с лентой хранятся ее валидаторы, как в CachedPageMixin.
+    """
+    feed_format = None
+    feed_cache_timeout = 600
+
+    def get_cached_feed(self, request):
+        """
+        Закешированная лента (текст, content type, валидаторы) или None; кеш читается
+        один раз за запрос. Неверный since вызывает ValueError.
+        """
+        if not hasattr(self, 'feed_cache_key'):
+            self.since = normalize_since(parse_since(request.GET.get('since')))
+            self.feed_query = build_feed_query(self.since, CursorPaginator.valid_cursor(request.GET.get('cursor')))
+            # в ленте абсолютные ссылки, поэтому адрес сайта входит в ключ
+            self.feed_cache_key = build_page_key(
+                request, f'{get_page_version()}:{request.build_absolute_uri("/")}:feed', self.feed_query)
+            self.cached_feed = get_page_cache().get(self.feed_cache_key)
+            observe_cache('feed', self.cached_feed is not None)
+        return self.cached_feed
+
+    def get_cached_validators(self, request, *args, **kwargs):
+        try:
+            feed = self.get_cached_feed(request)
+        except ValueError:
+            return None
+        return feed[2] if feed else None
+
+    def get(self, request, *args, **kwargs):
+        try:
+            feed = self.get_cached_feed(request)
+        except ValueError:
+            return HttpResponseBadRequest('Неверный параметр since')
+        if feed is None:
+            page = get_feed_page(self.since, self.feed_query.get('cursor'))
+            feed = (*build_feed(self.feed_format, request, page, self.feed_query), getattr(self, 'validators', None))
+            get_page_cache().set(self.feed_cache_key, feed, self.feed_cache_timeout)
+        content, content_type, _ = feed
+        return HttpResponse(content, content_type=content_type)
+
+
+class NewsFeedView(NewsListValidatorsMixin, ConditionalPageMixin, CachedFeedView):
+    """ Лента с валидаторами списков новостей: опрос без новых новостей получает 304. """
+
+
+class NewTextView(View):
+    """
+    Полный текст новости в JSON для кнопки «Развернуть» в карточке: списки
+    отдают только анонсы, а описание загружается, когда его действительно читают.
+    """
+    def get(self, request, pk):
+        row = New.objects.active().filter(pk=pk).values_list('updated_at', 'description', 'word_count').first()
+        if row is None:
+            raise Http404('Новость не найдена')
+        updated_at, description, word_count = row
+        etag, last_modified = build_validators(request, updated_at, updated_at)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = JsonResponse({'id': pk, 'description': description, 'word_count': word_count},
+                                    json_dumps_params={'ensure_ascii': False})
+        return set_validators(response, etag, last_modified)
+
+
+class NewSearchView(TemplateView):
+    """
+    Полнотекстовый поиск по новостям. Результаты ранжируются по релевантности,
+    страницы переключаются параметром page без подсчета общего количества.
+    """
+    template_name = 'search.html'
+    paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        try:
+            page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            raise Http404('Неверный номер страницы')
+        results = search_news(query, self.paginate_by + 1, (page - 1) * self.paginate_by) if query else []
+        context.update({
+            'query': query,
+            'results': results[:self.paginate_by],
+            'page': page,
+            'has_next': len(results) > self.paginate_by,
+            'has_previous': page > 1,
+        })
+        return context
+
+
+class MetricsView(View):
+    """
+    Метрики приложения в текстовом формате Prometheus. Доступны только
+    с адресов METRICS['ALLOWED_IPS'] (адрес берется из REMOTE_ADDR, а не из заголовков прокси).
+    """
+    def get(self, request, *args, **kwargs):
+        if request.META.get('REMOTE_ADDR') not in get_metrics_options()['ALLOWED_IPS']:
+            raise PermissionDenied
+        metrics = get_metrics()
+        if metrics is None:
+            return HttpResponse('Метрики выключены или не установлен prometheus_client\n', status=503,
+                                content_type='text/plain; charset=utf-8')
+        body, content_type = metrics.render()
+        return HttpResponse(body, content_type=content_type)
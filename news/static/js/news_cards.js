@@ -0,0 +1,37 @@
+// Карточки новостей выводят только анонс; полный текст загружается при первом «Развернуть».
+document.addEventListener('DOMContentLoaded', function() {
+  const toggleLinks = document.querySelectorAll('.toggle-description-link');
+
+  toggleLinks.forEach(link => {
+    const description = link.previousElementSibling;
+    const excerpt = description.innerText;
+    let fullText = null;
+
+    link.addEventListener('click', function(event) {
+      event.preventDefault();
+
+      if (description.classList.contains('expanded')) {
+        description.innerText = excerpt;
+        link.innerText = 'Развернуть';
+        description.classList.remove('expanded');
+        return;
+      }
+
+      const expand = function(text) {
+        fullText = text;
+        description.innerText = text;
+        link.innerText = 'Свернуть';
+        description.classList.add('expanded');
+      };
+
+      if (fullText !== null) {
+        expand(fullText);
+        return;
+      }
+      fetch(link.dataset.textUrl, {headers: {'Accept': 'application/json'}})
+        .then(response => response.ok ? response.json() : Promise.reject(response))
+        .then(data => expand(data.description))
+        .catch(() => { window.location.href = link.href; });
+    });
+  });
+});